@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from dataset_cache import save_frame, load_frame
+from instrumentation import timed
+
+# frames of the current worker process, memory-mapped once by _init_worker
+_frames = dict()
+# PreparedFrames of whole frames, shared by every figure the worker draws from them
+_prepared = dict()
+# label columns each frame is prepared with, see _categorical_columns
+_categorical = dict()
+# LevelOfDetails by data reference, so figures drawing the same one share its cells per zoom level
+_lods = dict()
+
+DEFAULT_CATEGORICAL = ('technology', 'name')
+
+
+def _init_worker(paths, categorical=None):
+    global _frames, _categorical
+    _frames = dict((name, load_frame(path)) for name, path in paths.items())
+    _prepared.clear()
+    _lods.clear()
+    _categorical = dict() if categorical is None else categorical
+
+
+def _categorical_columns(specs):
+    '''
+    Label columns to prepare each frame with: the defaults plus every column a multicolor spec splits that frame by
+    :return: dict of frame name -> tuple of column names
+    '''
+    columns = dict()
+    for spec in specs:
+        if spec['func'] != 'capacity_bubbleplot_multicolor' or not isinstance(spec['data'], str):
+            continue
+        args = spec.get('args', ())
+        split = spec.get('kwargs', {}).get('split', args[2] if len(args) > 2 else 'technology')
+        names = columns.setdefault(spec['data'], list(DEFAULT_CATEGORICAL))
+        if split not in names:
+            names.append(split)
+    return dict((name, tuple(names)) for name, names in columns.items())
+
+
+def _resolve_data(item):
+    '''
+    Turns one data reference of a figure spec into what the plot function takes. An item is either
+    the name of a shared frame, passed on as a PreparedFrame, or a dict with 'frame' and optional
+    steps applied in this order: 'query' (DataFrame.query string), 'top' ((column, n) largest rows),
+    'lod' (LevelOfDetail arguments) or 'grid' (rasterize arguments, plus 'idw' idw_fill arguments).
+    '''
+    if isinstance(item, str):
+        if item not in _prepared:
+            from plot_data import prepare_frame
+            _prepared[item] = prepare_frame(_frames[item], categorical=_categorical.get(item, DEFAULT_CATEGORICAL))
+        return _prepared[item]
+    key = json.dumps(item, sort_keys=True) if 'lod' in item else None
+    if key in _lods:
+        return _lods[key]
+    df = _frames[item['frame']]
+    if 'query' in item:
+        df = df.query(item['query'])
+    if 'top' in item:
+        column, n = item['top']
+        df = df.sort_values(column, ascending=False).head(n)
+    if 'lod' in item:
+        from level_of_detail import LevelOfDetail
+        _lods[key] = LevelOfDetail(df, **item['lod'])
+        return _lods[key]
+    if 'grid' in item:
+        from gridding import rasterize, idw_fill
+        grid_args = dict(item['grid'])
+        idw_args = grid_args.pop('idw', None)
+        grid = rasterize(df, **grid_args)
+        return grid if idw_args is None else idw_fill(grid, **idw_args)
+    return df
+
+
+def _render_spec(spec, backend, output_dir):
+    '''
+    Builds and renders one figure spec inside a worker
+    :return: what the render backend returned (a path or URL)
+    '''
+    import plot_data
+    func = getattr(plot_data, spec['func'])
+    data = spec['data']
+    data = [_resolve_data(d) for d in data] if isinstance(data, list) else _resolve_data(data)
+    args = spec.get('args', ())
+    kwargs = dict(spec.get('kwargs', {}))
+    if spec['func'] == 'capacity_histograms':
+        import matplotlib.pyplot as plt
+        plt.switch_backend('Agg')
+        kwargs.setdefault('filename', 'Capacity-Histograms')
+        func(data, *args, show=False, output_dir=output_dir, **kwargs)
+        return os.path.join(output_dir or plot_data.DEFAULT_OUTPUT_DIR, kwargs['filename'] + '.png')
+    fig = func(data, *args, show=False, **kwargs)
+    return plot_data.render(fig, plot_data.figure_name(args[0], kwargs.get('filename')), backend, output_dir)
+
+
+@timed('batch_render.render_batch')
+def render_batch(specs, frames, processes=None, backend=None, output_dir=None):
+    '''
+    Renders figure specs concurrently in a process pool. The frames are written once as memory-mappable
+    .npy columns that every worker maps, instead of being pickled into each task.
+    :param specs: list of dicts with 'func' (a plot_data function name), 'data' (a frame reference or
+                  list of them, see _resolve_data) and optional 'args' and 'kwargs' for the function
+    :param frames: dict of name -> dataframe referenced by the specs
+    :param processes: worker processes (default: one per CPU, at most one per spec)
+    :param backend: render backend name, see render.render
+    :param output_dir: directory figures are written to
+    :return: list of render results in spec order
+    '''
+    processes = min(processes or os.cpu_count() or 1, max(1, len(specs)))
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = dict()
+        for name, df in frames.items():
+            paths[name] = os.path.join(tmp, name)
+            save_frame(df, paths[name])
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(paths, _categorical_columns(specs))) as pool:
+            return list(pool.map(_render_spec, specs, [backend] * len(specs), [output_dir] * len(specs)))
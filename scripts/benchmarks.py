@@ -0,0 +1,425 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(SCRIPTS_DIR, 'benchmark_baseline.json')
+SUITE_SIZES = (10000, 100000, 1000000)
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# runs one loader in a fresh interpreter so its peak RSS is not mixed with other runs
+_RUNNER = '''
+import resource, sys, time
+sys.path.insert(0, {scripts!r})
+import benchmarks, geojson, read_data
+start = time.perf_counter()
+n = len(benchmarks.{loader}({filename!r}, {region!r}))
+elapsed = time.perf_counter() - start
+print(n, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def extract_wind_capacities_geojson(filename, region='east'):
+    '''
+    The original loader: reads the whole file and builds the geojson object tree
+    '''
+    import geojson
+    import pandas as pd
+    capstr = 'net_capacity_factor'
+    if region == 'west':
+        capstr = 'capacity_factor'
+    with open(filename, 'r') as f:
+        s = f.read()
+        j = geojson.loads(s)
+    data = [(e['geometry']['coordinates'][1], e['geometry']['coordinates'][0], e['properties'][capstr])
+            for e in j.features if isinstance(e, geojson.feature.Feature)]
+    return pd.DataFrame.from_records(data, columns=['lat', 'lon', 'capacity'])
+
+
+def extract_wind_capacities_streaming(filename, region='east'):
+    from read_data import extract_wind_capacities
+    return extract_wind_capacities(filename, region=region)
+
+
+def write_wind_geojson(filename, n, region='east', seed=0):
+    '''
+    Writes a synthetic WIND Toolkit site metadata file with n point features
+    '''
+    rng = np.random.default_rng(seed)
+    capstr = 'capacity_factor' if region == 'west' else 'net_capacity_factor'
+    lat = np.round(rng.uniform(25.0, 49.0, n) * 32) / 32
+    lon = np.round(rng.uniform(-125.0, -67.0, n) * 16) / 16
+    cap = rng.uniform(0.05, 0.6, n)
+    with open(filename, 'w') as f:
+        f.write('{{"type":"FeatureCollection","totalFeatures":{},"features":['.format(n))
+        for i in range(n):
+            if i:
+                f.write(',')
+            f.write(json.dumps({'type': 'Feature', 'id': '{}_wind_site_metadata.{}'.format(region, i),
+                                'geometry': {'type': 'Point', 'coordinates': [lon[i], lat[i]]},
+                                'geometry_name': 'the_geom_4326',
+                                'properties': {'gid': i, capstr: cap[i]}}, separators=(',', ':')))
+        f.write(']}')
+
+
+def aggregate_power_plant_capacities_loop(x):
+    '''
+    The original per-plant loop of extract_power_plant_capacities
+    '''
+    import pandas as pd
+    data = []
+    for pid in set(x['Plant ID']):
+        try:
+            df = x.loc[x['Plant ID'] == pid, ['Latitude', 'Longitude', 'Nameplate Capacity (MW)', 'Plant Name', 'Technology']]
+            data.append((df.iloc[0]['Latitude'], df.iloc[0]['Longitude'], sum(df['Nameplate Capacity (MW)']), df.iloc[0]['Plant Name'] + ' ({})'.format(df.iloc[0]['Technology'])))
+        except IndexError:
+            pass
+    return pd.DataFrame.from_records(data, columns=['lat', 'lon', 'capacity', 'name'])
+
+
+def make_generator_sheet(n, generators_per_plant=3, seed=0):
+    '''
+    Synthetic EIA-860M generator sheet with n generators, after column name stripping
+    '''
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    plants = max(1, n // generators_per_plant)
+    pid = rng.integers(1, plants + 1, n)
+    technologies = np.array(['Conventional Steam Coal', 'Natural Gas Fired Combined Cycle', 'Onshore Wind Turbine',
+                             'Solar Photovoltaic', 'Conventional Hydroelectric', 'Nuclear'])
+    statuses = np.array(['(OP) Operating', '(SB) Standby/Backup: available for service but not normally used',
+                         '(OS) Out of service but expected to return to service in next calendar year'])
+    plant_lat = rng.uniform(25.0, 49.0, plants + 1)
+    plant_lon = rng.uniform(-125.0, -67.0, plants + 1)
+    return pd.DataFrame({'Plant ID': pid,
+                         'Plant Name': np.char.add('Plant ', pid.astype(str)),
+                         'Latitude': plant_lat[pid],
+                         'Longitude': plant_lon[pid],
+                         'Nameplate Capacity (MW)': np.round(rng.lognormal(3.0, 1.5, n), 1),
+                         'Technology': technologies[pid % len(technologies)],
+                         'Status': statuses[rng.integers(0, len(statuses), n)]})
+
+
+def bench_power_plant_aggregation(n=50000):
+    '''
+    Times the per-plant loop against the groupby aggregation on a synthetic sheet and checks that
+    both give the same plants. Capacities are compared to float rounding: the groupby sums in a
+    different order than the loop, so the last digit can differ.
+    :return: dict of implementation -> seconds
+    '''
+    from read_data import aggregate_power_plant_capacities
+    x = make_generator_sheet(n)
+    results, frames = dict(), dict()
+    for name, func in [('loop', aggregate_power_plant_capacities_loop), ('groupby', aggregate_power_plant_capacities)]:
+        start = time.perf_counter()
+        frames[name] = func(x).sort_values('name', ignore_index=True)
+        results[name] = time.perf_counter() - start
+    loop, groupby = frames['loop'], frames['groupby']
+    if not (loop['name'].equals(groupby['name']) and np.array_equal(loop[['lat', 'lon']], groupby[['lat', 'lon']])
+            and np.allclose(loop['capacity'], groupby['capacity'], rtol=1e-12, atol=0.0, equal_nan=True)):
+        raise AssertionError('groupby aggregation differs from the per-plant loop')
+    return results
+
+
+def bench_offline_render(n=10000, seed=0):
+    '''
+    Renders a synthetic solar bubble map with the offline HTML backend into a temporary directory
+    :return: (seconds, bytes written)
+    '''
+    import pandas as pd
+    import plot_data
+    rng = np.random.default_rng(seed)
+    solar = pd.DataFrame({'lat': rng.uniform(25.0, 49.0, n), 'lon': rng.uniform(-125.0, -67.0, n),
+                          'capacity': rng.uniform(3.0, 6.0, n)})
+    with tempfile.TemporaryDirectory() as tmp:
+        fig = plot_data.capacity_bubbleplot(solar, 'Benchmark Solar', None, color='Reds', show=False)
+        start = time.perf_counter()
+        path = plot_data.render(fig, 'benchmark-solar', backend='html', output_dir=tmp)
+        elapsed = time.perf_counter() - start
+        return elapsed, os.path.getsize(path)
+
+
+def bench_wind_ingestion(filename, region='east'):
+    '''
+    Times both wind loaders on a file, each in its own process
+    :return: dict of loader -> (rows, seconds, peak RSS in kB)
+    '''
+    results = dict()
+    for loader in ['extract_wind_capacities_geojson', 'extract_wind_capacities_streaming']:
+        code = _RUNNER.format(scripts=SCRIPTS_DIR, loader=loader, filename=filename, region=region)
+        out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout.split()
+        results[loader] = (int(out[0]), float(out[1]), int(out[2]))
+    return results
+
+
+def write_solar_csv(filename, n, seed=0):
+    '''
+    Writes a synthetic solar capacity file in the schema of solar_capacities_ghi_nozeros.csv
+    '''
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({'lat': np.round(rng.uniform(25.0, 49.0, n) * 32) / 32,
+                  'lon': np.round(rng.uniform(-125.0, -67.0, n) * 16) / 16,
+                  'capacity': np.round(rng.uniform(3.0, 6.0, n), 2)}).to_csv(filename)
+
+
+class StubSolarResourceHandler(BaseHTTPRequestHandler):
+    '''
+    Answers solar resource requests locally with a deterministic response derived from lat/lon
+    '''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        lat, lon = float(query['lat'][0]), float(query['lon'][0])
+        outputs = dict()
+        for i, dtype in enumerate(['avg_dni', 'avg_ghi', 'avg_lat_tilt']):
+            annual = round(3.0 + (i + 1) * abs(np.sin(np.radians(lat * lon))), 2)
+            outputs[dtype] = {'annual': annual, 'monthly': dict((m, annual) for m in MONTHS)}
+        body = json.dumps({'inputs': {'lat': query['lat'][0], 'lon': query['lon'][0]}, 'errors': [],
+                           'outputs': outputs}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_stub_server():
+    '''
+    Starts a StubSolarResourceHandler server on a free local port in a daemon thread
+    :return: (server, URL to pass as url= to the NREL functions); call server.shutdown() when done
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubSolarResourceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/api/solar/solar_resource/v1.json'.format(server.server_address[1])
+
+
+def _stage_encode(ctx):
+    from geohash import encode
+    return [encode(lat, lon, 5) for lat, lon in ctx['coordinates']]
+
+
+def _stage_encode_many(ctx):
+    from geohash import encode_many
+    return encode_many(ctx['points']['lat'].values, ctx['points']['lon'].values, 5)
+
+
+def _stage_limit_coordinates(ctx):
+    from read_data import limit_coordinates
+    return limit_coordinates(ctx['coordinates'], precision=4)
+
+
+def _stage_limit_df_coordinates(ctx):
+    from read_data import limit_df_coordinates
+    return limit_df_coordinates(ctx['points'], precision=4)
+
+
+def _stage_limit_df_coordinates_chunked(ctx):
+    from read_data import limit_df_coordinates_chunked
+    return limit_df_coordinates_chunked(ctx['solar_csv'], precision=4, chunk_rows=100000, index_col=0)
+
+
+def _stage_load_solar(ctx):
+    from read_data import load_solar_capacities
+    return load_solar_capacities(ctx['solar_csv'])
+
+
+def _stage_extract_wind(ctx):
+    from read_data import extract_wind_capacities
+    return extract_wind_capacities(ctx['wind_geojson'], region='east')
+
+
+def _stage_query_solar(ctx):
+    from read_data import query_solar_capacities
+    return query_solar_capacities('stub', coordinates=ctx['coordinates'], hash_precision=3, hourly_limit=None,
+                                  per_second_limit=None, url=ctx['stub_url'])
+
+
+def _stage_level_of_detail(ctx):
+    from level_of_detail import LevelOfDetail
+    return LevelOfDetail(ctx['points'], max_points=5000).cells(3)
+
+
+def _stage_rasterize(ctx):
+    from gridding import rasterize, idw_fill
+    return idw_fill(rasterize(ctx['points'], resolution=0.25), max_km=50)
+
+
+def _stage_bubbleplot(ctx):
+    import plot_data
+    return plot_data.capacity_bubbleplot(ctx['points'], 'Benchmark Solar', 0.0035, color='rgb(250,194,5)',
+                                         relative=True, logit=True, show=False)
+
+
+def _stage_bubbleplot_multicolor(ctx):
+    import plot_data
+    return plot_data.capacity_bubbleplot_multicolor(ctx['plants'], 'Benchmark Plants', 10, show=False)
+
+
+# stage name -> function of the prepared inputs; each stage is timed on its own
+STAGES = {
+    'encode': _stage_encode,
+    'encode_many': _stage_encode_many,
+    'limit_coordinates': _stage_limit_coordinates,
+    'limit_df_coordinates': _stage_limit_df_coordinates,
+    'limit_df_coordinates_chunked': _stage_limit_df_coordinates_chunked,
+    'load_solar_capacities': _stage_load_solar,
+    'extract_wind_capacities': _stage_extract_wind,
+    'query_solar_capacities': _stage_query_solar,
+    'level_of_detail': _stage_level_of_detail,
+    'rasterize_idw': _stage_rasterize,
+    'capacity_bubbleplot': _stage_bubbleplot,
+    'capacity_bubbleplot_multicolor': _stage_bubbleplot_multicolor,
+}
+
+
+def make_inputs(n, directory, seed=0):
+    '''
+    Writes and loads the synthetic inputs of every stage for n points
+    :param directory: where the synthetic solar CSV and wind GeoJSON files go
+    :return: dict of input name -> value
+    '''
+    import pandas as pd
+    solar_csv = os.path.join(directory, 'solar_{}.csv'.format(n))
+    wind_geojson = os.path.join(directory, 'wind_{}.json'.format(n))
+    if not os.path.exists(solar_csv):
+        write_solar_csv(solar_csv, n, seed=seed)
+    if not os.path.exists(wind_geojson):
+        write_wind_geojson(wind_geojson, n, seed=seed)
+    points = pd.read_csv(solar_csv, index_col=0)
+    rng = np.random.default_rng(seed)
+    plants = points.assign(capacity=np.round(rng.lognormal(3.0, 1.5, n), 1),
+                           technology=rng.choice(['Coal', 'Natural Gas', 'Wind', 'Solar', 'Hydro', 'Nuclear'], n))
+    plants['text'] = plants['technology']
+    return {'points': points, 'plants': plants, 'coordinates': list(zip(points['lat'], points['lon'])),
+            'solar_csv': solar_csv, 'wind_geojson': wind_geojson}
+
+
+def measure(func, ctx, repeat=3):
+    '''
+    Times func(ctx) and records the peak memory it allocates. An untimed warm-up call first pays
+    one-off costs such as lazy imports, so they do not show up as regressions with repeat=1.
+    :return: (best wall time in seconds over repeat runs, peak traced allocation in bytes from one extra run)
+    '''
+    func(ctx)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(ctx)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def run_suite(sizes=SUITE_SIZES, stages=None, data_dir=None, repeat=3, verbose=True):
+    '''
+    Runs every stage at every size against synthetic data and a local stub of the NREL API
+    :param stages: names of STAGES to run (default: all)
+    :param data_dir: directory the synthetic files are kept in between runs (default: a temporary directory)
+    :return: dict of '<stage>/<size>' -> {'seconds': ..., 'peak_mb': ...}
+    '''
+    stages = list(STAGES) if stages is None else stages
+    results = dict()
+    server, url = start_stub_server()
+    tmp = tempfile.TemporaryDirectory() if data_dir is None else None
+    directory = tmp.name if tmp is not None else data_dir
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for n in sizes:
+            ctx = make_inputs(n, directory)
+            ctx['stub_url'] = url
+            for name in stages:
+                seconds, peak = measure(STAGES[name], ctx, repeat=repeat)
+                results['{}/{}'.format(name, n)] = {'seconds': round(seconds, 6), 'peak_mb': round(peak / 1e6, 3)}
+                if verbose:
+                    print('{:<32} {:>8} {:>10.3f} s {:>10.1f} MB'.format(name, n, seconds, peak / 1e6))
+    finally:
+        server.shutdown()
+        if tmp is not None:
+            tmp.cleanup()
+    return results
+
+
+def save_baseline(results, filename=DEFAULT_BASELINE):
+    with open(filename, 'w') as f:
+        json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1, sort_keys=True)
+
+
+def compare_to_baseline(results, filename=DEFAULT_BASELINE, tolerance=1.25):
+    '''
+    Compares results with a stored baseline
+    :param tolerance: ratio to the baseline above which a time or peak memory counts as a regression
+    :return: list of (key, metric, baseline value, current value) regressions
+    '''
+    with open(filename, 'r') as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for key, current in sorted(results.items()):
+        if key not in baseline:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            if current[metric] > baseline[key][metric] * tolerance:
+                regressions.append((key, metric, baseline[key][metric], current[metric]))
+    return regressions
+
+
+def compare_loaders(sizes=(10000, 100000)):
+    '''
+    Prints the old-vs-new comparisons: wind GeoJSON loaders, plant aggregation and offline rendering
+    '''
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            filename = os.path.join(tmp, 'wind_{}.json'.format(n))
+            write_wind_geojson(filename, n)
+            size_mb = os.path.getsize(filename) / 1e6
+            for loader, (rows, seconds, rss) in bench_wind_ingestion(filename).items():
+                print('{:>8} features ({:.1f} MB) {:<35} {:.3f} s  peak RSS {:.1f} MB'.format(
+                    rows, size_mb, loader, seconds, rss / 1024))
+    for name, seconds in bench_power_plant_aggregation().items():
+        print('{:>8} generators {:<35} {:.3f} s'.format(50000, name, seconds))
+    seconds, size = bench_offline_render()
+    print('{:>8} points     {:<35} {:.3f} s  {:.1f} MB'.format(10000, 'offline html render', seconds, size / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks the geohash, ingestion, dedup and plotting stages')
+    parser.add_argument('sizes', nargs='*', type=int, default=list(SUITE_SIZES), help='synthetic dataset sizes')
+    parser.add_argument('--stages', nargs='+', choices=sorted(STAGES), help='stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage; the best is kept')
+    parser.add_argument('--data-dir', help='keep the synthetic input files here between runs')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    parser.add_argument('--compare-loaders', action='store_true', help='run the old-vs-new loader comparisons instead')
+    args = parser.parse_args()
+    if args.compare_loaders:
+        compare_loaders()
+        sys.exit(0)
+    results = run_suite(args.sizes, args.stages, args.data_dir, args.repeat)
+    if args.save:
+        save_baseline(results, args.baseline)
+        print('Saved baseline to {}'.format(args.baseline))
+    elif os.path.exists(args.baseline):
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for key, metric, before, after in regressions:
+            print('REGRESSION {:<40} {:<8} {} -> {}'.format(key, metric, before, after))
+        if regressions:
+            sys.exit(1)
+        print('No regressions against {}'.format(args.baseline))
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'cache')
+
+
+def _digest(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def cache_key(name, source, params):
+    '''
+    Names a cache entry. The first part identifies loader, source path and parse parameters;
+    the second the state (mtime and size) of the source file, so an edited source gets a new key.
+    '''
+    path = os.path.abspath(source)
+    st = os.stat(path)
+    return '{}-{}-{}'.format(name, _digest([path, params]), _digest([st.st_mtime_ns, st.st_size]))
+
+
+def save_frame(df, path):
+    '''
+    Saves a dataframe as one .npy file per column plus a JSON description, written to a
+    temporary directory first so a crashed save never leaves a half-written entry
+    '''
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = {'columns': [], 'index_name': df.index.name}
+    columns = [('__index__', df.index.to_series())] + [(str(c), df[c]) for c in df.columns]
+    for i, (name, col) in enumerate(columns):
+        entry = {'name': name, 'file': '{}.npy'.format(i), 'kind': 'numeric'}
+        if col.dtype.kind in 'biuf':
+            np.save(os.path.join(tmp, entry['file']), np.ascontiguousarray(col.values))
+        else:
+            entry['kind'] = 'string'
+            missing = col.isna().values
+            np.save(os.path.join(tmp, entry['file']), np.asarray(col.where(~missing, '').astype(str).values, dtype=str))
+            if missing.any():
+                entry['missing'] = 'missing-{}.npy'.format(i)
+                np.save(os.path.join(tmp, entry['missing']), missing)
+        meta['columns'].append(entry)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def load_frame(path):
+    '''
+    Loads a dataframe written by save_frame. Numeric columns are memory-mapped copy-on-write, so edits
+    stay in memory and never reach the cache file.
+    '''
+    import pandas as pd
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    data = dict()
+    index = None
+    for entry in meta['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode='c' if entry['kind'] == 'numeric' else None)
+        if entry['kind'] == 'string':
+            values = values.astype(object)
+            if 'missing' in entry:
+                values[np.load(os.path.join(path, entry['missing']))] = np.nan
+        if entry['name'] == '__index__':
+            index = pd.Index(values, name=meta['index_name'])
+        else:
+            data[entry['name']] = values
+    return pd.DataFrame(data, index=index, copy=False)
+
+
+def cached_frame(loader, source, cache_dir=DEFAULT_CACHE_DIR, **params):
+    '''
+    Returns loader(source, **params), reusing a cached copy while the source file is unchanged
+    :param loader: function parsing source into a dataframe
+    :param source: path of the file loader parses
+    :param cache_dir: directory holding cache entries, or None to always parse
+    :param params: keyword arguments for loader; they are part of the cache key
+    :return: dataframe
+    '''
+    if cache_dir is None:
+        return loader(source, **params)
+    key = cache_key(loader.__name__.strip('_'), source, params)
+    path = os.path.join(cache_dir, key)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        return load_frame(path)
+    df = loader(source, **params)
+    os.makedirs(cache_dir, exist_ok=True)
+    # entries for the same source and parameters but an older file are stale
+    prefix = key.rsplit('-', 1)[0] + '-'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != key:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+    save_frame(df, path)
+    return df
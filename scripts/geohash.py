@@ -15,6 +15,7 @@ License along with Geohash.  If not, see
 <http://www.gnu.org/licenses/>.
 """
 from math import log10
+import numpy as np
 
 #  Note: the alphabet in geohash differs from the common base32
 #  alphabet described in IETF's RFC 4648
@@ -104,4 +105,316 @@ def encode(latitude, longitude, precision=12):
             geohash += __base32[ch]
             bit = 0
             ch = 0
-    return ''.join(geohash)
\ No newline at end of file
+    return ''.join(geohash)
+
+#  Vectorized variants.  Instead of bisecting one bit at a time these
+#  quantize each coordinate to an integer cell index and interleave the
+#  bits, which yields exactly the same hashes as encode()/decode_exactly()
+#  because every bisection midpoint is a dyadic value that float64
+#  represents without rounding.
+__base32_bytes = np.frombuffer(__base32.encode('ascii'), dtype=np.uint8)
+__decodetable = np.full(256, -1, dtype=np.int64)
+__decodetable[__base32_bytes] = np.arange(len(__base32))
+
+def _bit_counts(nbits):
+    """
+    Split a total bit count into (longitude bits, latitude bits).
+    Longitude always takes the first (most significant) bit.
+    """
+    return (nbits + 1) // 2, nbits // 2
+
+def _quantize(values, lo, hi, nbits):
+    """
+    Map float values onto the 2**nbits bisection cells of [lo, hi] the
+    same way encode() does: a value equal to a midpoint goes to the
+    lower half.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ncells = 1 << nbits
+    width = (hi - lo) / ncells
+    with np.errstate(invalid='ignore'):
+        q = np.ceil((values - lo) / width) - 1
+    q = np.where(np.isnan(q), 0, np.clip(q, 0, ncells - 1)).astype(np.int64)
+    # the subtraction above can round; nudge by one cell where it did
+    q -= (q > 0) & (values <= lo + q * width)
+    q += (q < ncells - 1) & (values > lo + (q + 1) * width)
+    return q.astype(np.uint64)
+
+def _spread_bits(v):
+    """
+    Insert a zero bit above every bit of the (at most 32 bit) values in v.
+    """
+    v = v.astype(np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+def _compact_bits(v):
+    """
+    Inverse of _spread_bits: gather every other bit of v, starting at bit 0.
+    """
+    v = v.astype(np.uint64) & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v
+
+def _interleave(lon_q, lat_q, nbits):
+    """
+    Interleave longitude and latitude cell indices into an nbits code.
+    """
+    lon_shift = np.uint64(1 - nbits % 2)
+    lat_shift = np.uint64(nbits % 2)
+    return (_spread_bits(lon_q) << lon_shift) | (_spread_bits(lat_q) << lat_shift)
+
+def _deinterleave(codes, nbits):
+    """
+    Split nbits interleaved codes back into (longitude, latitude) indices.
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    lon_shift = np.uint64(1 - nbits % 2)
+    lat_shift = np.uint64(nbits % 2)
+    return _compact_bits(codes >> lon_shift), _compact_bits(codes >> lat_shift)
+
+def _codes_to_strings(codes, precision):
+    """
+    Render interleaved integer codes as base32 geohash strings.
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    if precision == 0:
+        return np.full(codes.shape, '', dtype='<U1')
+    shifts = np.uint64(5) * np.arange(precision - 1, -1, -1, dtype=np.uint64)
+    digits = (codes[..., np.newaxis] >> shifts) & np.uint64(31)
+    chars = np.ascontiguousarray(__base32_bytes[digits.astype(np.intp)])
+    return chars.view('S%d' % precision)[..., 0].astype('<U%d' % precision)
+
+def _strings_to_codes(hashes, precision):
+    """
+    Parse base32 geohash strings, all of the given length, into
+    interleaved integer codes.
+    """
+    raw = np.asarray(hashes, dtype='S%d' % max(precision, 1))
+    chars = raw.view(np.uint8).reshape(raw.shape + (max(precision, 1),))[..., :precision]
+    digits = __decodetable[chars]
+    if (digits < 0).any():
+        raise KeyError('Invalid geohash character')
+    codes = np.zeros(raw.shape, dtype=np.uint64)
+    for k in range(precision):
+        codes = (codes << np.uint64(5)) | digits[..., k].astype(np.uint64)
+    return codes
+
+def _encode_codes(latitudes, longitudes, precision):
+    """
+    Right-aligned interleaved codes of 5 * precision bits.
+    """
+    if not 0 <= precision <= 12:
+        raise ValueError('precision must be between 0 and 12')
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if latitudes.shape != longitudes.shape:
+        raise ValueError('latitude and longitude arrays differ in shape')
+    nbits = 5 * precision
+    lon_bits, lat_bits = _bit_counts(nbits)
+    return _interleave(_quantize(longitudes, -180.0, 180.0, lon_bits),
+                       _quantize(latitudes, -90.0, 90.0, lat_bits), nbits)
+
+def encode_many(latitudes, longitudes, precision=12):
+    """
+    Encode arrays of latitudes and longitudes to an array of geohashes
+    of the given character count.  Gives the same hashes as calling
+    encode() on every pair.  precision may be at most 12.
+    """
+    return _codes_to_strings(_encode_codes(latitudes, longitudes, precision), precision)
+
+def decode_exactly_many(geohashes):
+    """
+    Decode an array of geohashes to four float arrays: latitude,
+    longitude and the plus/minus errors for latitude and longitude,
+    matching decode_exactly() element by element.  Geohashes may be at
+    most 12 characters long.
+    """
+    return decode_exactly_int(geohash_to_int(geohashes))
+
+def _format_many(values, errors):
+    """
+    Vectorized counterpart of the string formatting done in decode().
+    """
+    out = np.empty(values.shape, dtype=object)
+    for err in np.unique(errors):
+        sel = errors == err
+        s = np.char.mod('%%.%df' % (max(1, int(round(-log10(err)))) - 1), values[sel])
+        dotted = np.char.find(s, '.') >= 0
+        s = np.where(dotted, np.char.rstrip(s, '0'), s)
+        s = np.where(np.char.endswith(s, '.'), np.char.add(s, '0'), s)
+        out[sel] = s
+    return out.astype(str)
+
+def decode_many(geohashes):
+    """
+    Decode an array of geohashes, returning two arrays of latitude and
+    longitude strings formatted exactly as decode() formats them.
+    """
+    lat, lon, lat_err, lon_err = decode_exactly_many(geohashes)
+    return _format_many(lat, lat_err), _format_many(lon, lon_err)
+
+
+#  Packed integer geohashes.  A geohash of up to 12 characters carries at
+#  most 60 bits, so it fits in a uint64 together with its precision:
+#
+#      bits 63..4   interleaved code, left-aligned, unused low bits zero
+#      bits  3..0   precision (number of base32 characters)
+#
+#  Left alignment keeps the integer order identical to the string order,
+#  a prefix is obtained by masking off low bits, and keys of equal
+#  precision compare equal exactly when their strings do.  Arrays of keys
+#  can be stored directly as a uint64 NumPy array or pandas column.
+__precision_mask = np.uint64(0xF)
+
+def _pack(codes, precision):
+    """
+    Pack right-aligned codes of the given precision into integer keys.
+    """
+    codes = np.asarray(codes, dtype=np.uint64)
+    if precision == 0:
+        return np.zeros(codes.shape, dtype=np.uint64)
+    return (codes << np.uint64(64 - 5 * precision)) | np.uint64(precision)
+
+def _unpack(keys, precision):
+    """
+    Right-aligned codes of keys that all have the given precision.
+    """
+    if precision == 0:
+        return np.zeros(keys.shape, dtype=np.uint64)
+    return keys >> np.uint64(64 - 5 * precision)
+
+def int_precision(keys):
+    """
+    Return the precision stored in each integer geohash key.
+    """
+    return (np.asarray(keys, dtype=np.uint64) & __precision_mask).astype(np.int64)
+
+def encode_int_many(latitudes, longitudes, precision=12):
+    """
+    Encode arrays of latitudes and longitudes to packed uint64 geohash
+    keys.  int_to_geohash() of the result equals encode_many().
+    """
+    return _pack(_encode_codes(latitudes, longitudes, precision), precision)
+
+def encode_int(latitude, longitude, precision=12):
+    """
+    Encode a single position to a packed integer geohash key.
+    """
+    return int(encode_int_many(latitude, longitude, precision))
+
+def truncate_int(keys, precision):
+    """
+    Shorten integer geohash keys to the given precision, the integer
+    equivalent of slicing geohash[:precision].  Keys already at or below
+    that precision are returned unchanged.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    current = int_precision(keys)
+    if precision == 0:
+        return np.where(current > 0, np.uint64(0), keys)
+    code_mask = np.uint64(((1 << (5 * precision)) - 1) << (64 - 5 * precision))
+    return np.where(current > precision, (keys & code_mask) | np.uint64(precision), keys)
+
+def int_to_geohash(keys):
+    """
+    Convert packed integer geohash keys back to base32 geohash strings.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    precisions = int_precision(keys)
+    out = np.empty(keys.shape, dtype='<U12')
+    for precision in np.unique(precisions):
+        sel = precisions == precision
+        out[sel] = _codes_to_strings(_unpack(keys[sel], int(precision)), int(precision))
+    return out
+
+def geohash_to_int(geohashes):
+    """
+    Convert base32 geohash strings (of any mix of lengths up to 12) to
+    packed integer geohash keys.
+    """
+    geohashes = np.asarray(geohashes, dtype=str)
+    keys = np.empty(geohashes.shape, dtype=np.uint64)
+    lengths = np.char.str_len(geohashes)
+    if (lengths > 12).any():
+        raise ValueError('geohashes longer than 12 characters do not fit in 64 bits')
+    for precision in np.unique(lengths):
+        sel = lengths == precision
+        keys[sel] = _pack(_strings_to_codes(geohashes[sel], int(precision)), int(precision))
+    return keys
+
+def decode_exactly_int(keys):
+    """
+    Decode packed integer geohash keys to latitude, longitude and their
+    plus/minus errors, as decode_exactly_many() does for strings.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    lat = np.empty(keys.shape, dtype=np.float64)
+    lon = np.empty(keys.shape, dtype=np.float64)
+    lat_err = np.empty(keys.shape, dtype=np.float64)
+    lon_err = np.empty(keys.shape, dtype=np.float64)
+    precisions = int_precision(keys)
+    for precision in np.unique(precisions):
+        sel = precisions == precision
+        nbits = 5 * int(precision)
+        lon_bits, lat_bits = _bit_counts(nbits)
+        lon_q, lat_q = _deinterleave(_unpack(keys[sel], int(precision)), nbits)
+        lon_width = 360.0 / (1 << lon_bits)
+        lat_width = 180.0 / (1 << lat_bits)
+        lon[sel] = -180.0 + lon_q * lon_width + lon_width / 2
+        lat[sel] = -90.0 + lat_q * lat_width + lat_width / 2
+        lon_err[sel] = lon_width / 2
+        lat_err[sel] = lat_width / 2
+    return lat, lon, lat_err, lon_err
+
+def cell_indices_int(keys, precision):
+    """
+    Split integer geohash keys of the given precision into their
+    longitude and latitude cell indices.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    lon_q, lat_q = _deinterleave(_unpack(keys, precision), 5 * precision)
+    return lon_q.astype(np.int64), lat_q.astype(np.int64)
+
+def int_from_cell_indices(lon_q, lat_q, precision):
+    """
+    Build integer geohash keys of the given precision from longitude and
+    latitude cell indices.  Longitude indices wrap around the
+    antimeridian; latitude indices must lie inside the grid.
+    """
+    lon_bits, lat_bits = _bit_counts(5 * precision)
+    lon_q = np.mod(np.asarray(lon_q, dtype=np.int64), 1 << lon_bits)
+    lat_q = np.asarray(lat_q, dtype=np.int64)
+    return _pack(_interleave(lon_q.astype(np.uint64), lat_q.astype(np.uint64), 5 * precision), precision)
+
+def neighbors_int_many(keys, precision, ring=1):
+    """
+    Return the keys of all cells within ring cells of each key (the key
+    itself included) as an array with one extra trailing axis of length
+    (2 * ring + 1) ** 2.  Cells beyond the poles are returned as 0.
+    """
+    lon_bits, lat_bits = _bit_counts(5 * precision)
+    lon_q, lat_q = cell_indices_int(keys, precision)
+    offsets = np.arange(-ring, ring + 1)
+    dlon, dlat = np.meshgrid(offsets, offsets)
+    lon_n = lon_q[..., np.newaxis] + dlon.ravel()
+    lat_n = lat_q[..., np.newaxis] + dlat.ravel()
+    inside = (lat_n >= 0) & (lat_n < (1 << lat_bits))
+    out = int_from_cell_indices(lon_n, np.clip(lat_n, 0, (1 << lat_bits) - 1), precision)
+    return np.where(inside, out, np.uint64(0))
+
+def neighbors(geohash):
+    """
+    Return the geohashes of the eight cells adjacent to geohash.
+    """
+    precision = len(geohash)
+    keys = neighbors_int_many(geohash_to_int([geohash]), precision)[0]
+    return [h for k, h in zip(keys.tolist(), int_to_geohash(keys).tolist()) if k and h != geohash]
@@ -0,0 +1,97 @@
+import json
+import numpy as np
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+
+def iter_features(f, chunk_bytes=1 << 20):
+    '''
+    Streams the members of the 'features' array of a GeoJSON FeatureCollection one at a time,
+    holding at most one feature plus one read chunk in memory
+    :param f: text file object
+    :param chunk_bytes: characters read per chunk
+    :return: generator of decoded feature dicts
+    '''
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_bytes)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    # find the opening bracket of the features array
+    while True:
+        key = buf.find('"features"', pos)
+        if key >= 0:
+            bracket = buf.find('[', key)
+            if bracket >= 0:
+                pos = bracket + 1
+                break
+        if eof:
+            raise ValueError('No features array found')
+        # keep the key if the bracket is still to come, else a tail that may hold the start of the key
+        pos = key if key >= 0 else max(pos, len(buf) - len('"features"'))
+        fill()
+
+    while True:
+        while pos < len(buf) and buf[pos] in _whitespace + ',':
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError('Unterminated features array')
+            fill()
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            obj, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buf) and not eof:
+            # a number at the end of the buffer may continue in the next chunk
+            fill()
+            continue
+        pos = end
+        yield obj
+
+
+def read_point_features(filename, properties, chunk_rows=65536, chunk_bytes=1 << 20):
+    '''
+    Reads the Point features of a GeoJSON file into NumPy arrays, growing them a chunk at a time
+    :param filename: string of filename
+    :param properties: candidate property names for the value column; the first one present is used
+    :return: (lat, lon, value) float64 arrays
+    '''
+    lat = np.empty(chunk_rows, dtype=np.float64)
+    lon = np.empty(chunk_rows, dtype=np.float64)
+    value = np.empty(chunk_rows, dtype=np.float64)
+    n = 0
+    with open(filename, 'r') as f:
+        for feature in iter_features(f, chunk_bytes):
+            if not isinstance(feature, dict) or feature.get('type') != 'Feature':
+                continue
+            props = feature.get('properties') or {}
+            for prop in properties:
+                if prop in props:
+                    break
+            else:
+                continue
+            if n == len(lat):
+                lat = np.resize(lat, n + chunk_rows)
+                lon = np.resize(lon, n + chunk_rows)
+                value = np.resize(value, n + chunk_rows)
+            coords = feature['geometry']['coordinates']
+            lon[n] = coords[0]
+            lat[n] = coords[1]
+            value[n] = np.nan if props[prop] is None else props[prop]
+            n += 1
+    return lat[:n], lon[:n], value[:n]
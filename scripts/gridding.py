@@ -0,0 +1,116 @@
+import numpy as np
+from spatial_index import GeohashIndex
+
+# lat_min, lat_max, lon_min, lon_max of the contiguous United States
+CONUS_BOUNDS = (24.0, 50.0, -125.0, -66.0)
+
+
+class Grid:
+    '''
+    A regular lat/lon raster. values[i, j] covers latitudes lat_edges[i]..lat_edges[i + 1] and
+    longitudes lon_edges[j]..lon_edges[j + 1]; empty cells are NaN.
+    '''
+
+    def __init__(self, values, lat_edges, lon_edges):
+        self.values = values
+        self.lat_edges = lat_edges
+        self.lon_edges = lon_edges
+
+    @property
+    def lat_centers(self):
+        return (self.lat_edges[:-1] + self.lat_edges[1:]) / 2
+
+    @property
+    def lon_centers(self):
+        return (self.lon_edges[:-1] + self.lon_edges[1:]) / 2
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def save(self, filename):
+        '''
+        Saves the grid as a NumPy .npz archive of .npy arrays
+        '''
+        np.savez(filename, values=self.values, lat_edges=self.lat_edges, lon_edges=self.lon_edges)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['values'], f['lat_edges'], f['lon_edges'])
+
+
+def rasterize(df, resolution=0.25, bounds=CONUS_BOUNDS, stat='mean', column='capacity', dtype=np.float32):
+    '''
+    Bins points onto a regular grid in one vectorized pass
+    :param df: dataframe with lat, lon and column
+    :param resolution: cell size in degrees
+    :param bounds: (lat_min, lat_max, lon_min, lon_max); points outside are dropped
+    :param stat: 'mean', 'sum', 'max' or 'count' of column per cell
+    :return: Grid
+    '''
+    lat_min, lat_max, lon_min, lon_max = bounds
+    nlat = int(np.ceil((lat_max - lat_min) / resolution))
+    nlon = int(np.ceil((lon_max - lon_min) / resolution))
+    lat_edges = lat_min + resolution * np.arange(nlat + 1)
+    lon_edges = lon_min + resolution * np.arange(nlon + 1)
+    lat = df['lat'].values.astype(np.float64)
+    lon = df['lon'].values.astype(np.float64)
+    values = df[column].values.astype(np.float64)
+    i = np.floor((lat - lat_min) / resolution).astype(np.int64)
+    j = np.floor((lon - lon_min) / resolution).astype(np.int64)
+    inside = (i >= 0) & (i < nlat) & (j >= 0) & (j < nlon) & ~np.isnan(values)
+    flat = i[inside] * nlon + j[inside]
+    values = values[inside]
+    count = np.bincount(flat, minlength=nlat * nlon)
+    if stat == 'count':
+        out = count.astype(np.float64)
+    elif stat in ('sum', 'mean'):
+        out = np.bincount(flat, weights=values, minlength=nlat * nlon)
+        if stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = out / count
+    elif stat == 'max':
+        out = np.full(nlat * nlon, -np.inf)
+        np.maximum.at(out, flat, values)
+    else:
+        raise ValueError('Unknown stat {}'.format(stat))
+    if stat != 'count':
+        out[count == 0] = np.nan
+    return Grid(out.reshape(nlat, nlon).astype(dtype), lat_edges, lon_edges)
+
+
+def idw_fill(grid, k=8, power=2.0, max_km=None):
+    '''
+    Fills empty cells by inverse-distance weighting of the k nearest non-empty cells
+    :param max_km: only weight non-empty cells within this distance; cells with none stay empty
+    :return: new Grid
+    '''
+    values = grid.values.astype(np.float64)
+    lat, lon = np.meshgrid(grid.lat_centers, grid.lon_centers, indexing='ij')
+    known = ~np.isnan(values)
+    if known.all() or not known.any():
+        return Grid(values.astype(grid.values.dtype), grid.lat_edges, grid.lon_edges)
+    index = GeohashIndex(lat[known], lon[known], precision=4)
+    dist, idx = index.query(lat[~known], lon[~known], k=min(k, int(known.sum())), max_km=max_km)
+    weights = np.where(idx >= 0, 1.0 / np.maximum(dist, 1e-6) ** power, 0.0)
+    with np.errstate(invalid='ignore'):
+        filled = (weights * values[known][np.maximum(idx, 0)]).sum(axis=1) / weights.sum(axis=1)
+    out = values.copy()
+    out[~known] = filled
+    return Grid(out.astype(grid.values.dtype), grid.lat_edges, grid.lon_edges)
+
+
+def mercator_image(grid, height=None):
+    '''
+    Resamples grid rows so they are evenly spaced in web-mercator y, as a map image layer expects.
+    Row 0 of the result is the northern edge.
+    '''
+    def merc(lat):
+        return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+    height = height or grid.shape[0]
+    y_edges = np.linspace(merc(grid.lat_edges[-1]), merc(grid.lat_edges[0]), height + 1)
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    lat_centers = np.degrees(2 * np.arctan(np.exp(y_centers)) - np.pi / 2)
+    rows = np.clip(np.searchsorted(grid.lat_edges, lat_centers, side='right') - 1, 0, grid.shape[0] - 1)
+    return grid.values[rows]
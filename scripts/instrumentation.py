@@ -0,0 +1,182 @@
+import contextlib
+import json
+import math
+import os
+import threading
+import time
+
+# file the __main__ runs write their metrics to; .prom for Prometheus text, anything else for JSON
+METRICS_FILE = os.environ.get('PIPELINE_METRICS')
+
+# upper bounds in seconds of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _prometheus_value(value):
+    '''
+    Formats a sample value; Prometheus spells the non-finite ones NaN, +Inf and -Inf
+    '''
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('+Inf' if value > 0 else '-Inf')
+    return str(value)
+
+
+class Histogram:
+    '''
+    Cumulative bucket counts plus count and sum of observed values, as in a Prometheus histogram
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        cumulative, total = dict(), 0
+        for bound, n in zip([str(b) for b in self.buckets] + ['+Inf'], self.counts):
+            total += n
+            cumulative[bound] = total
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class Metrics:
+    '''
+    Thread-safe registry of stage timings, counters, gauges and histograms for one run
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timers = dict()
+            self.counters = dict()
+            self.gauges = dict()
+            self.histograms = dict()
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            calls, total = self.timers.get(name, (0, 0.0))
+            self.timers[name] = (calls + 1, total + seconds)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def counter(self, name):
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(buckets)
+            self.histograms[name].observe(value)
+
+    def as_dict(self):
+        with self._lock:
+            return {'timers': dict((name, {'calls': calls, 'seconds': total})
+                                   for name, (calls, total) in self.timers.items()),
+                    'counters': dict(self.counters),
+                    'gauges': dict(self.gauges),
+                    'histograms': dict((name, h.as_dict()) for name, h in self.histograms.items())}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=1, sort_keys=True)
+
+    def to_prometheus(self, prefix='solarwind'):
+        '''
+        Renders the metrics in the Prometheus text exposition format
+        '''
+        def metric(name):
+            return prefix + '_' + name.replace('.', '_').replace('-', '_')
+
+        d = self.as_dict()
+        lines = []
+        for name, t in sorted(d['timers'].items()):
+            lines.append('# TYPE {}_seconds summary'.format(metric(name)))
+            lines.append('{}_seconds_count {}'.format(metric(name), t['calls']))
+            lines.append('{}_seconds_sum {}'.format(metric(name), _prometheus_value(t['seconds'])))
+        for name, value in sorted(d['counters'].items()):
+            lines.append('# TYPE {}_total counter'.format(metric(name)))
+            lines.append('{}_total {}'.format(metric(name), _prometheus_value(value)))
+        for name, value in sorted(d['gauges'].items()):
+            lines.append('# TYPE {} gauge'.format(metric(name)))
+            lines.append('{} {}'.format(metric(name), _prometheus_value(value)))
+        for name, h in sorted(d['histograms'].items()):
+            lines.append('# TYPE {} histogram'.format(metric(name)))
+            for bound, n in h['buckets'].items():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric(name), bound, n))
+            lines.append('{}_count {}'.format(metric(name), h['count']))
+            lines.append('{}_sum {}'.format(metric(name), _prometheus_value(h['sum'])))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        '''
+        Writes the metrics to filename: Prometheus text for .prom files, JSON otherwise
+        '''
+        with open(filename, 'w') as f:
+            f.write(self.to_prometheus() if filename.endswith('.prom') else self.to_json())
+
+
+# registry the pipeline modules report to
+METRICS = Metrics()
+
+
+def write_metrics(filename=None):
+    '''
+    Writes METRICS to filename (default METRICS_FILE); does nothing if neither is set
+    :return: the file written, or None
+    '''
+    filename = METRICS_FILE if filename is None else filename
+    if filename:
+        METRICS.write(filename)
+    return filename
+
+
+class timed(contextlib.ContextDecorator):
+    '''
+    Adds the wall time of a block or of every call of a decorated function to a stage timer
+    :param name: stage name, e.g. 'read_data.extract_wind_capacities'
+    :param metrics: registry to report to (default METRICS)
+    '''
+
+    def __init__(self, name, metrics=None):
+        self.name = name
+        self.metrics = metrics
+
+    def _recreate_cm(self):
+        # a fresh timer per decorated call, so concurrent and recursive calls do not share a start time
+        return timed(self.name, self.metrics)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        (METRICS if self.metrics is None else self.metrics).add_time(self.name, time.perf_counter() - self._start)
+        return False
+
+
+def record_dedup(name, rows_in, rows_out, metrics=None):
+    '''
+    Counts rows into and out of a dedup step and sets its dedup ratio (rows out / rows in) gauge
+    '''
+    metrics = METRICS if metrics is None else metrics
+    metrics.count(name + '.rows_in', rows_in)
+    metrics.count(name + '.rows_out', rows_out)
+    metrics.gauge(name + '.dedup_ratio', rows_out / rows_in if rows_in else math.nan)
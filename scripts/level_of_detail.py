@@ -0,0 +1,94 @@
+import numpy as np
+from geohash import encode_int_many, truncate_int
+
+MAX_PRECISION = 8
+
+
+def precision_for_zoom(zoom, min_cell_px=8):
+    '''
+    Finest geohash precision whose cells are at least min_cell_px wide on a web-mercator map at zoom
+    (the world is 256 * 2 ** zoom px wide)
+    '''
+    max_lon_bits = int(np.floor(zoom + 8 - np.log2(min_cell_px)))
+    precision = 1
+    while precision < MAX_PRECISION and (5 * (precision + 1) + 1) // 2 <= max_lon_bits:
+        precision += 1
+    return precision
+
+
+class LevelOfDetail:
+    '''
+    Aggregates a lat/lon/capacity dataframe into geohash cells for a target map zoom, so a plot
+    emits one marker per occupied cell instead of one per point. Points are hashed once; the cells
+    for each zoom are computed on first use and reused afterwards.
+    :param df: dataframe with lat, lon and capacity columns
+    :param agg: 'mean' or 'max' of capacity per cell
+    :param split: optional column whose groups are aggregated separately (e.g. technology);
+                  its value is kept on each cell
+    :param max_points: if given, coarsen the cells until at most this many remain
+    '''
+
+    def __init__(self, df, agg='mean', split=None, max_points=None):
+        if agg not in ('mean', 'max'):
+            raise ValueError('agg must be mean or max')
+        self.agg = agg
+        self.split = split
+        self.max_points = max_points
+        self.lat = df['lat'].values.astype(np.float64)
+        self.lon = df['lon'].values.astype(np.float64)
+        self.capacity = df['capacity'].values.astype(np.float64)
+        self.groups = None
+        self.group_values = None
+        if split is not None:
+            self.group_values, self.groups = np.unique(df[split].astype(str).values, return_inverse=True)
+            self.groups = self.groups.ravel()
+        self.keys = encode_int_many(self.lat, self.lon, MAX_PRECISION)
+        self._cells = dict()
+
+    def cells_at_precision(self, precision):
+        '''
+        :return: dataframe with one row per occupied cell (per split group): lat, lon (mean position
+                 of the cell's points), capacity, count and the split column
+        '''
+        if precision in self._cells:
+            return self._cells[precision]
+        import pandas as pd
+        keys = truncate_int(self.keys, precision)
+        if self.groups is None:
+            cells, inverse = np.unique(keys, return_inverse=True)
+        else:
+            pairs = np.stack([keys, self.groups.astype(np.uint64)], axis=1)
+            cells, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        n = len(cells)
+        count = np.bincount(inverse, minlength=n)
+        lat = np.bincount(inverse, weights=self.lat, minlength=n) / count
+        lon = np.bincount(inverse, weights=self.lon, minlength=n) / count
+        if self.agg == 'mean':
+            capacity = np.bincount(inverse, weights=self.capacity, minlength=n) / count
+        else:
+            capacity = np.full(n, -np.inf)
+            np.maximum.at(capacity, inverse, self.capacity)
+        out = pd.DataFrame({'lat': lat, 'lon': lon, 'capacity': capacity, 'count': count})
+        if self.groups is not None:
+            out[self.split] = self.group_values[cells[:, 1].astype(np.int64)]
+        self._cells[precision] = out
+        return out
+
+    def cells(self, zoom):
+        '''
+        Cells for a map zoom level, coarsened further if there would be more than max_points
+        '''
+        precision = precision_for_zoom(zoom)
+        out = self.cells_at_precision(precision)
+        while self.max_points is not None and len(out) > self.max_points and precision > 1:
+            precision -= 1
+            out = self.cells_at_precision(precision)
+        return out
+
+
+def cell_text(cells, fmt='{:.2f}', label='Capacity'):
+    '''
+    Hover text for aggregated cells: the point count and aggregated capacity
+    '''
+    return (cells['count'].map('{} sites'.format) + '<br>' + label + ': ' + cells['capacity'].map(fmt.format))
@@ -0,0 +1,186 @@
+import threading
+import time as tm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from instrumentation import METRICS
+
+SOLAR_RESOURCE_URL = 'https://developer.nrel.gov/api/solar/solar_resource/v1.json'
+
+# NREL developer network default quotas for an API key
+HOURLY_LIMIT = 1000
+PER_SECOND_LIMIT = 1.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket. acquire() blocks until a token is available.
+    :param rate: tokens added per second
+    :param capacity: maximum number of tokens held (burst size)
+    '''
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = tm.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                self._refill(tm.monotonic())
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            tm.sleep(wait)
+
+
+class RateLimiter:
+    '''
+    Combines several token buckets; a request goes out only once every bucket grants it.
+    :param hourly_limit: requests allowed per hour, or None for no hourly limit
+    :param per_second_limit: sustained requests per second, or None for no limit
+    '''
+
+    def __init__(self, hourly_limit=HOURLY_LIMIT, per_second_limit=PER_SECOND_LIMIT):
+        self.buckets = []
+        if hourly_limit is not None:
+            self.buckets.append(TokenBucket(hourly_limit / 3600.0, hourly_limit))
+        if per_second_limit is not None:
+            self.buckets.append(TokenBucket(per_second_limit, max(1.0, per_second_limit)))
+
+    def acquire(self):
+        for bucket in self.buckets:
+            bucket.acquire()
+
+
+class NRELError(Exception):
+    '''
+    Raised when the NREL API returns an error that retrying will not fix.
+    '''
+    pass
+
+
+def make_session(pool_size=8):
+    '''
+    Creates a keep-alive session whose connection pool can serve pool_size threads
+    :param pool_size: number of pooled connections per host
+    :return: requests.Session
+    '''
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_solar_resource(session, api_key, lat, lon, limiter=None, url=SOLAR_RESOURCE_URL, retries=5,
+                         backoff=1.0, timeout=30.0):
+    '''
+    Requests the solar resource for one location, retrying 429 and 5xx responses with exponential backoff
+    :param session: requests.Session to send the request on
+    :param api_key: NREL API key
+    :param lat: latitude of the query point
+    :param lon: longitude of the query point
+    :param limiter: RateLimiter consulted before every attempt, or None
+    :param retries: number of retries after the first attempt
+    :param backoff: base delay in seconds, doubled after every retry
+    :return: (decoded JSON response, number of retries used)
+    '''
+    import requests
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        METRICS.count('nrel.requests')
+        if attempt:
+            METRICS.count('nrel.retries')
+        start = tm.perf_counter()
+        try:
+            r = session.get(url, params={'api_key': api_key, 'lat': lat, 'lon': lon}, timeout=timeout)
+        except requests.ConnectionError:
+            METRICS.observe('nrel.request_seconds', tm.perf_counter() - start)
+            METRICS.count('nrel.connection_errors')
+            if attempt == retries:
+                raise
+            tm.sleep(backoff * 2 ** attempt)
+            continue
+        METRICS.observe('nrel.request_seconds', tm.perf_counter() - start)
+        METRICS.count('nrel.http_{}'.format(r.status_code))
+        if r.status_code in RETRY_STATUSES and attempt < retries:
+            delay = backoff * 2 ** attempt
+            try:
+                delay = max(delay, float(r.headers.get('Retry-After', 0)))
+            except ValueError:
+                pass
+            tm.sleep(delay)
+            continue
+        if r.status_code != 200:
+            # a retryable status here means the retries are exhausted
+            try:
+                message = r.json().get('error', {}).get('message')
+            except ValueError:
+                message = None
+            raise NRELError(message or 'HTTP {} for ({}, {})'.format(r.status_code, lat, lon))
+        return r.json(), attempt
+
+
+def fetch_solar_resources(api_key, hashdict, max_workers=8, hourly_limit=HOURLY_LIMIT,
+                          per_second_limit=PER_SECOND_LIMIT, url=SOLAR_RESOURCE_URL, retries=5, backoff=1.0,
+                          session=None, cache=None, verbose=False):
+    '''
+    Queries the solar resource API for every geohash cell concurrently, sharing one pooled session
+    and one rate limiter between all worker threads
+    :param api_key: NREL API key
+    :param hashdict: dict of geohash -> (lat, lon) query point, as made by limit_coordinates
+    :param max_workers: maximum number of requests in flight
+    :param hourly_limit: requests allowed per hour
+    :param per_second_limit: sustained requests per second
+    :param cache: ResponseCache; cached cells are not requested and new responses are stored as they arrive
+    :return: (dict of geohash -> decoded JSON response, dict of geohash -> exception for failed cells)
+    '''
+    results, errors = dict(), dict()
+    if cache is not None:
+        results.update(cache.get_many(url, hashdict.keys()))
+        hashdict = dict((h, coord) for h, coord in hashdict.items() if h not in results)
+        METRICS.count('nrel.cache_hits', len(results))
+    if not hashdict:
+        return results, errors
+    requests_before = METRICS.counter('nrel.requests')
+    start = tm.perf_counter()
+    limiter = RateLimiter(hourly_limit, per_second_limit)
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(fetch_solar_resource, session, api_key, qlat, qlon, limiter, url, retries,
+                                   backoff): h
+                       for h, (qlat, qlon) in hashdict.items()}
+            for count, future in enumerate(as_completed(futures), 1):
+                h = futures[future]
+                try:
+                    results[h] = future.result()[0]
+                    if cache is not None:
+                        cache.put(url, h, results[h])
+                except Exception as e:
+                    errors[h] = e
+                    METRICS.count('nrel.failed_cells')
+                    print(e)
+                if verbose and count % 100 == 0:
+                    print('Made {} requests of {}'.format(count, len(futures)))
+    finally:
+        if own_session:
+            session.close()
+        elapsed = tm.perf_counter() - start
+        if elapsed > 0:
+            METRICS.gauge('nrel.achieved_requests_per_second',
+                          (METRICS.counter('nrel.requests') - requests_before) / elapsed)
+    return results, errors
@@ -0,0 +1,298 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+from dataset_cache import save_frame, load_frame, _digest
+from instrumentation import timed, write_metrics
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+DEFAULT_WORK_DIR = os.path.join(DATA_DIR, 'pipeline')
+
+
+class Stage:
+    '''
+    One step of the pipeline
+    :param name: stage name, also the name its output is passed to downstream stages under
+    :param func: function(params, **upstream outputs) returning a dataframe or a JSON-serialisable value
+    :param inputs: names of the stages whose outputs func takes
+    :param files: names of params holding source file paths; their contents are part of the stage key
+    :param params: names of params that change the output; their values are part of the stage key
+    '''
+
+    def __init__(self, name, func, inputs=(), files=(), params=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.files = tuple(files)
+        self.params = tuple(params)
+
+
+def file_digest(path, memo=None):
+    '''
+    SHA-1 of a file's contents. memo maps path -> [mtime_ns, size, digest] and spares rereading
+    files whose mtime and size are unchanged.
+    '''
+    st = os.stat(path)
+    path = os.path.abspath(path)
+    if memo is not None and memo.get(path, [None, None])[:2] == [st.st_mtime_ns, st.st_size]:
+        return memo[path][2]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    if memo is not None:
+        memo[path] = [st.st_mtime_ns, st.st_size, h.hexdigest()]
+    return h.hexdigest()
+
+
+def output_digest(value):
+    '''
+    Content hash of a stage output, so downstream stages only rerun when an output really changed
+    '''
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+        h = hashlib.sha1(json.dumps([str(c) for c in value.columns]).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        return h.hexdigest()[:16]
+    return _digest(value)
+
+
+class Pipeline:
+    '''
+    Runs stages in dependency order and reruns only those whose key changed. A stage key hashes its
+    params, the contents of its source files and the output hashes of its upstream stages. Outputs
+    are stored in work_dir, dataframes as memory-mapped columns (see dataset_cache.save_frame).
+    :param stages: list of Stage, each listed after the stages it takes inputs from
+    :param params: dict of parameter values the stages read
+    :param work_dir: directory for stored outputs and the state file
+    '''
+
+    def __init__(self, stages, params, work_dir=DEFAULT_WORK_DIR):
+        self.stages = dict((stage.name, stage) for stage in stages)
+        self.order = [stage.name for stage in stages]
+        for stage in stages:
+            for name in stage.inputs:
+                if self.order.index(name) > self.order.index(stage.name):
+                    raise ValueError('Stage {} is listed before its input {}'.format(stage.name, name))
+        self.params = params
+        self.work_dir = work_dir
+        self.state_file = os.path.join(work_dir, 'state.json')
+        self.state = {'stages': dict(), 'files': dict()}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'r') as f:
+                self.state = json.load(f)
+
+    def _save_state(self):
+        os.makedirs(self.work_dir, exist_ok=True)
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.state_file)
+
+    def key(self, name):
+        '''
+        Key of a stage given the current params, source files and recorded upstream outputs
+        '''
+        stage = self.stages[name]
+        files = [file_digest(self.params[p], self.state['files']) for p in stage.files]
+        upstream = [self.state['stages'].get(i, {}).get('output') for i in stage.inputs]
+        return _digest([name, [self.params.get(p) for p in stage.params], files, upstream])
+
+    def _closure(self, targets):
+        '''
+        Targets plus every stage they depend on, in pipeline order
+        '''
+        needed, todo = set(), list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].inputs)
+        return [name for name in self.order if name in needed]
+
+    def _path(self, name, key):
+        return os.path.join(self.work_dir, '{}-{}'.format(name, key))
+
+    def _load(self, name):
+        entry = self.state['stages'][name]
+        path = self._path(name, entry['key'])
+        if entry['kind'] == 'frame':
+            return load_frame(path)
+        with open(path + '.json', 'r') as f:
+            return json.load(f)
+
+    def _store(self, name, key, value):
+        import pandas as pd
+        os.makedirs(self.work_dir, exist_ok=True)
+        for entry in os.listdir(self.work_dir):
+            if entry.startswith(name + '-'):
+                target = os.path.join(self.work_dir, entry)
+                if os.path.isdir(target):
+                    shutil.rmtree(target, ignore_errors=True)
+                else:
+                    os.remove(target)
+        path = self._path(name, key)
+        if isinstance(value, pd.DataFrame):
+            save_frame(value, path)
+            kind = 'frame'
+        else:
+            with open(path + '.json', 'w') as f:
+                json.dump(value, f)
+            kind = 'json'
+        self.state['stages'][name] = {'key': key, 'kind': kind, 'output': output_digest(value)}
+        self._save_state()
+
+    def is_current(self, name):
+        entry = self.state['stages'].get(name)
+        try:
+            if entry is None or entry['key'] != self.key(name):
+                return False
+        except FileNotFoundError:
+            # a missing source file; running the stage reports it
+            return False
+        path = self._path(name, entry['key'])
+        return os.path.exists(os.path.join(path, 'meta.json') if entry['kind'] == 'frame' else path + '.json')
+
+    def status(self, targets=None):
+        '''
+        :return: list of (stage, True if its stored output is current); a stage whose upstream is not
+                 current is reported as not current either
+        '''
+        stale, out = set(), []
+        for name in self._closure(targets or self.order):
+            current = not stale.intersection(self.stages[name].inputs) and self.is_current(name)
+            if not current:
+                stale.add(name)
+            out.append((name, current))
+        return out
+
+    def run(self, targets=None, force=(), verbose=True):
+        '''
+        Brings targets (default: all stages) up to date, running only stages that are not current
+        :param force: stages to rerun even when current
+        :return: dict of stage -> 'ran' or 'cached'
+        '''
+        outputs, report = dict(), dict()
+        for name in self._closure(targets or self.order):
+            stage = self.stages[name]
+            if name not in force and self.is_current(name):
+                report[name] = 'cached'
+            else:
+                args = dict((i, outputs[i] if i in outputs else self._load(i)) for i in stage.inputs)
+                with timed('pipeline.' + name):
+                    value = stage.func(self.params, **args)
+                self._store(name, self.key(name), value)
+                outputs[name] = value
+                report[name] = 'ran'
+            if verbose:
+                print('{:<12} {}'.format(name, report[name]))
+        return report
+
+
+def ingest_wind(region):
+    def ingest(params):
+        from read_data import extract_wind_capacities
+        return extract_wind_capacities(params['wind_' + region], region=region)
+    return ingest
+
+
+def ingest_plants(params):
+    import re
+    from read_data import extract_power_plant_capacities
+    pp = extract_power_plant_capacities(params['plants'])
+    pp['text'] = pp['name'] + '<br>Production Capacity: ' + pp['capacity'].map('{:.1f}'.format) + ' MW'
+    pp['technology'] = pp['name'].map(lambda x: re.match(r'.*\((.*)\)', x).group(1))
+    return pp
+
+
+def fetch_solar(params, plants=None, wind_west=None, wind_east=None):
+    '''
+    Queries NREL for the plant and wind site locations, or reads params['solar_csv'] when no API key is set
+    '''
+    import pandas as pd
+    from read_data import query_solar_capacities, load_solar_capacities
+    if not params.get('api_key'):
+        return load_solar_capacities(params['solar_csv'])
+    coords = pd.concat([df[['lat', 'lon']] for df in (plants, wind_west, wind_east)], ignore_index=True)
+    return query_solar_capacities(params['api_key'], df=coords, dtype=params['solar_dtype'],
+                                  hash_precision=params['precision'], cache=params.get('response_cache'))
+
+
+def dedup_solar(params, solar):
+    from read_data import limit_df_coordinates
+    solar = limit_df_coordinates(solar, params['precision'])
+    solar['text'] = 'Global Horizontal Irradiance: ' + solar['capacity'].map('{:.1f}'.format) + ' kWh/m^2/day'
+    return solar
+
+
+def scale_wind(params, wind_west, wind_east):
+    '''
+    Scales east capacity factors to the west ones, merges both and dedups the result
+    '''
+    import pandas as pd
+    from read_data import bootstrap_wind_scaling_factor, limit_df_coordinates
+    estimate = bootstrap_wind_scaling_factor(wind_west, wind_east, n_boot=params['n_boot'])
+    print('East wind scaling factor {factor:.3f} (95% CI {low:.3f}-{high:.3f}, {cells} cells)'.format(**estimate))
+    wind_east = wind_east.assign(capacity=wind_east['capacity'] * estimate['factor'])
+    wind = limit_df_coordinates(pd.concat([wind_west, wind_east], ignore_index=True), precision=params['precision'])
+    wind['text'] = 'Capacity Factor: ' + wind['capacity'].map('{:.2f}'.format)
+    return wind
+
+
+def plot(params, plants, dedup, scale):
+    from batch_render import render_batch
+    from plot_data import figure_specs
+    return render_batch(figure_specs(), {'pp': plants, 'solar': dedup, 'wind': scale}, backend=params['backend'],
+                        output_dir=params['output_dir'])
+
+
+def build_pipeline(params, work_dir=DEFAULT_WORK_DIR):
+    '''
+    The standard DAG: ingest wind and plants, fetch solar, dedup, scale, plot
+    '''
+    query = bool(params.get('api_key'))
+    return Pipeline([
+        Stage('wind_west', ingest_wind('west'), files=('wind_west',)),
+        Stage('wind_east', ingest_wind('east'), files=('wind_east',)),
+        Stage('plants', ingest_plants, files=('plants',)),
+        Stage('solar', fetch_solar, inputs=('plants', 'wind_west', 'wind_east') if query else (),
+              files=() if query else ('solar_csv',), params=('solar_dtype', 'precision') if query else ()),
+        Stage('dedup', dedup_solar, inputs=('solar',), params=('precision',)),
+        Stage('scale', scale_wind, inputs=('wind_west', 'wind_east'), params=('precision', 'n_boot')),
+        Stage('plot', plot, inputs=('plants', 'dedup', 'scale'), params=('backend', 'output_dir')),
+    ], params, work_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the ingest, solar, dedup, scale and plot stages, '
+                                                 'rerunning only stages whose inputs or parameters changed')
+    parser.add_argument('command', choices=['run', 'status'])
+    parser.add_argument('stages', nargs='*', help='target stages (default: all)')
+    parser.add_argument('--force', nargs='+', default=[], help='rerun these stages even if current')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR)
+    parser.add_argument('--wind-west', default=os.path.join(DATA_DIR, 'nrel-west_wind_site_metadata.json'))
+    parser.add_argument('--wind-east', default=os.path.join(DATA_DIR, 'nrel-east_wind_site_metadata.json'))
+    parser.add_argument('--plants', default=os.path.join(DATA_DIR, 'december_generator2017.xlsx'))
+    parser.add_argument('--solar-csv', default=os.path.join(DATA_DIR, 'solar_capacities_ghi_nozeros.csv'),
+                        help='solar capacities to use when no API key is given')
+    parser.add_argument('--api-key', default=os.environ.get('NREL_API_KEY'), help='query NREL instead of --solar-csv')
+    parser.add_argument('--response-cache', help='SQLite response cache for NREL queries')
+    parser.add_argument('--solar-dtype', default='avg_ghi')
+    parser.add_argument('--precision', type=int, default=4, help='geohash precision of the dedup')
+    parser.add_argument('--n-boot', type=int, default=2000, help='bootstrap resamples of the wind scaling factor')
+    parser.add_argument('--backend', default=None, help='render backend (default: render.DEFAULT_BACKEND)')
+    parser.add_argument('--output-dir', default=None, help='directory figures are written to')
+    args = parser.parse_args()
+    params = dict((k, v) for k, v in vars(args).items() if k not in ('command', 'stages', 'force', 'work_dir'))
+    pipeline = build_pipeline(params, args.work_dir)
+    unknown = set(args.stages + args.force) - set(pipeline.order)
+    if unknown:
+        parser.error('unknown stages: {}'.format(', '.join(sorted(unknown))))
+    if args.command == 'status':
+        for name, current in pipeline.status(args.stages):
+            print('{:<12} {}'.format(name, 'current' if current else 'stale'))
+        sys.exit(0)
+    pipeline.run(args.stages, force=args.force)
+    write_metrics()
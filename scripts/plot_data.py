@@ -1,20 +1,14 @@
-import math
+import base64
+import functools
+import io
+import os
 import re
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-import plotly.graph_objs as go
-import plotly.offline
-import plotly.plotly as py
 from read_data import *
-import configparser
-
-config = configparser.ConfigParser()
-config.sections()
-config.read('config.ini')
-
-plotly.tools.set_credentials_file(username=config['DEFAULT']['NREL_USERNAME'], api_key=config['DEFAULT']['NREL_API_KEY'])
-MAPBOX_ACCESS_TOKEN = config['DEFAULT']['MAPBOX_ACCESS_TOKEN']
+from render import render, figure_name, DEFAULT_OUTPUT_DIR
+from instrumentation import timed, write_metrics
+from level_of_detail import LevelOfDetail, cell_text
+from gridding import mercator_image
 
 colors = ['#800000', '#8B0000', '#A52A2A', '#B22222', '#DC143C', '#FF0000', '#FF6347', '#FF7F50', '#CD5C5C', '#F08080',
           '#E9967A', '#FA8072', '#FFA07A', '#FF4500', '#FF8C00', '#FFA500', '#FFD700', '#B8860B', '#DAA520', '#EEE8AA',
@@ -32,9 +26,169 @@ colors = ['#800000', '#8B0000', '#A52A2A', '#B22222', '#DC143C', '#FF0000', '#FF
           '#000000', '#696969', '#808080', '#A9A9A9', '#C0C0C0', '#D3D3D3', '#DCDCDC', '#F5F5F5', '#FFFFFF']
 
 
+@functools.lru_cache(maxsize=None)
+def _is_rgb(color):
+    '''
+    True for a fixed 'rgb(...)' colour, False for a colour scale name
+    '''
+    return re.match(r'rgb\(.*\)', color) is not None
+
+
+@functools.lru_cache(maxsize=None)
+def mapbox_access_token():
+    '''
+    Mapbox token from config.ini, falling back to the MAPBOX_ACCESS_TOKEN environment variable;
+    read on the first map figure rather than at import
+    '''
+    import configparser
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    return config['DEFAULT'].get('MAPBOX_ACCESS_TOKEN', os.environ.get('MAPBOX_ACCESS_TOKEN'))
+
+
+@functools.lru_cache(maxsize=None)
+def base_layout(zoom=3):
+    '''
+    Mapbox layout shared by every map figure, built once per zoom level
+    '''
+    import plotly.graph_objs as go
+    return go.Layout(
+        showlegend=True,
+        mapbox=go.layout.Mapbox(
+            accesstoken=mapbox_access_token(),
+            bearing=0,
+            center=go.layout.mapbox.Center(
+                lat=38,
+                lon=-94
+            ),
+            pitch=0,
+            zoom=zoom,
+            # style='light'
+        ),
+        autosize=True,
+        hovermode='closest'
+    )
+
+
+def map_layout(title_string, zoom=3, **updates):
+    '''
+    Copy of the shared base layout with a title and any other layout properties set
+    '''
+    import plotly.graph_objs as go
+    layout = go.Layout(base_layout(zoom))
+    layout.title = go.layout.Title(text=title_string)
+    layout.update(**updates)
+    return layout
+
+
+class PreparedFrame:
+    '''
+    Plot-ready copy of a lat/lon/capacity dataframe: float32 coordinates and capacities, categorical
+    label columns, and hover text, sizes, split groups and jitter computed on first use and reused by
+    every figure drawn from it. The source dataframe is never modified.
+    :param df: dataframe with lat, lon, capacity and optional text and label columns
+    :param text: function of df returning the hover text, called on first use; defaults to the text column
+    :param categorical: label columns to keep, stored as pandas Categoricals
+    '''
+
+    def __init__(self, df, text=None, categorical=('technology', 'name')):
+        import pandas as pd
+        self.lat = np.asarray(df['lat'].values, dtype=np.float32)
+        self.lon = np.asarray(df['lon'].values, dtype=np.float32)
+        self.capacity = np.asarray(df['capacity'].values, dtype=np.float32)
+        self.labels = dict((c, pd.Categorical(df[c])) for c in categorical if c in df.columns)
+        self._df = df if text is not None else None
+        self._text = text if text is not None else (df['text'] if 'text' in df.columns else None)
+        self._cache = dict()
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _memo(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def text(self):
+        '''
+        Hover text as an object array, or None
+        '''
+        def build():
+            text = self._text(self._df) if callable(self._text) else self._text
+            self._df = None
+            return None if text is None else np.asarray(text, dtype=object)
+        return self._memo('text', build)
+
+    def relative(self):
+        '''
+        Capacity rescaled to 0..1
+        '''
+        def build():
+            low, high = np.nanmin(self.capacity), np.nanmax(self.capacity)
+            return (self.capacity - low) / (high - low)
+        return self._memo('relative', build)
+
+    def sizes(self, scale, relative=False):
+        '''
+        Marker sizes: 10 for every marker if scale is None, else (relative) capacity / scale
+        '''
+        if scale is None:
+            return 10
+        return self._memo(('sizes', scale, relative),
+                          lambda: (self.relative() if relative else self.capacity) / np.float32(scale))
+
+    def groups(self, column):
+        '''
+        List of (label, row indices) for each label of a categorical column, in sorted label order
+        '''
+        def build():
+            labels = self.labels[column]
+            codes = labels.codes
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(labels.categories) + 1))
+            return [(label, order[bounds[i]:bounds[i + 1]]) for i, label in enumerate(labels.categories)
+                    if bounds[i + 1] > bounds[i]]
+        return self._memo(('groups', column), build)
+
+    def jittered(self, amount=0.005, seed=0):
+        '''
+        (lon, lat) with gaussian jitter, drawn once so overlapping markers of several datasets stay visible
+        '''
+        def build():
+            rng = np.random.default_rng(seed)
+            noise = (amount * rng.standard_normal((2, len(self)))).astype(np.float32)
+            return self.lon + noise[0], self.lat + noise[1]
+        return self._memo(('jittered', amount, seed), build)
+
+
+def prepare_frame(df, text=None, categorical=('technology', 'name')):
+    '''
+    Returns df as a PreparedFrame; prepare once and pass the result to several figures to share the work
+    '''
+    return df if isinstance(df, PreparedFrame) else PreparedFrame(df, text, categorical)
+
+
+def _resolve_frame(df, zoom, legend_string, categorical=('technology', 'name')):
+    '''
+    Returns the frame to plot as a PreparedFrame: df itself, or the cells of a LevelOfDetail for the zoom level
+    '''
+    if isinstance(df, LevelOfDetail):
+        cells = df.cells(zoom)
+        return PreparedFrame(cells, text=lambda c: cell_text(c, label=legend_string), categorical=categorical)
+    return df if isinstance(df, PreparedFrame) else PreparedFrame(df, categorical=categorical)
+
+
+# the logit option predates PreparedFrame: the transform was computed and discarded, so sizes stay
+# linear in the relative capacity; it is accepted for compatibility and has no effect
+
+@timed('plot_data.capacity_bubbleplot')
 def capacity_bubbleplot(df, title_string, scale, color='rgb(0,116,217)', filename=None, show=True,
-                        legend_string='Capacity', relative=False, logit=False):
+                        legend_string='Capacity', relative=False, logit=False, zoom=3,
+                        backend=None):
+    import plotly.graph_objs as go
     pts = []
+    df = _resolve_frame(df, zoom, legend_string)
     # pt = go.Scattergeo(
     #     locationmode = 'USA-states',
     #     lon = df['lon'],
@@ -50,25 +204,18 @@ def capacity_bubbleplot(df, title_string, scale, color='rgb(0,116,217)', filenam
     #     ),
     #     name = legend_string
     #  )
-    if relative:
-        df['relative'] = (df['capacity'] - min(df['capacity'])) / (max(df['capacity']) - min(df['capacity']))
-        if logit:
-            df['relative'].apply(lambda x: 1.0 / (1.0 + 2.0 * math.exp(x - 0.5)))
-    sz = 10
-    if scale is not None:
-        sz = df['relative'] / scale if relative else df['capacity'] / scale
     pt = go.Scattermapbox(
-        lon=df['lon'],
-        lat=df['lat'],
-        text=df['text'] if 'text' in df.columns else None,
+        lon=df.lon,
+        lat=df.lat,
+        text=df.text,
         marker=go.scattermapbox.Marker(
-            size=sz,
-            color=df['capacity'] if not re.match(r'rgb\(.*\)', color) else color,
-            colorscale=color if not re.match(r'rgb\(.*\)', color) else None,
-            showscale=True if not re.match(r'rgb\(.*\)', color) else False,
+            size=df.sizes(scale, relative),
+            color=df.capacity if not _is_rgb(color) else color,
+            colorscale=color if not _is_rgb(color) else None,
+            showscale=True if not _is_rgb(color) else False,
             reversescale=True if color in {'Greens'} else False,
             sizemode='area',
-            opacity=0.5 if re.match(r'rgb\(.*\)', color) else 0.8,
+            opacity=0.5 if _is_rgb(color) else 0.8,
             sizemin=1
         ),
         line=go.scattermapbox.Line(
@@ -77,65 +224,32 @@ def capacity_bubbleplot(df, title_string, scale, color='rgb(0,116,217)', filenam
         name=legend_string
     )
     pts.append(pt)
-    layout = go.Layout(
-        title=go.layout.Title(
-            text=title_string
-        ),
-        showlegend=True,
-        # geo = go.layout.Geo(
-        #     scope = 'usa',
-        #     projection = go.layout.geo.Projection(
-        #         type='albers usa'
-        #     ),
-        #     showland = True,
-        #     landcolor = 'rgb(217, 217, 217)',
-        #     subunitwidth=1,
-        #     countrywidth=1,
-        #     subunitcolor="rgb(255, 255, 255)",
-        #     countrycolor="rgb(255, 255, 255)"
-        # )
-        mapbox=go.layout.Mapbox(
-            accesstoken=MAPBOX_ACCESS_TOKEN,
-            bearing=0,
-            center=go.layout.mapbox.Center(
-                lat=38,
-                lon=-94
-            ),
-            pitch=0,
-            zoom=3,
-            # style='light''
-        ),
-        autosize=True,
-        hovermode='closest'
-    )
+    layout = map_layout(title_string, zoom)
 
     fig = go.Figure(data=pts, layout=layout)
 
-    if show: py.plot(fig, filename=re.sub(r'[\s/]+', '-', title_string) if filename is None else filename)
+    if show: render(fig, figure_name(title_string, filename), backend)
     return fig
 
 
+@timed('plot_data.capacity_bubbleplot_multicolor')
 def capacity_bubbleplot_multicolor(df, title_string, scale, split='technology', filename=None, show=True,
-                                      legend_string='Capacity', relative=False, logit=False):
+                                      legend_string='Capacity', relative=False, logit=False, zoom=3, backend=None):
+    import plotly.graph_objs as go
     pts = []
-    color_set = dict([(col, idx) for idx, col in enumerate(set(pp[split]))])
-    pp['color'] = pp[split].map(lambda x: colors[(color_set[x] * len(colors) // len(color_set)) % len(colors)])
-    if relative:
-        df['relative'] = (df['capacity'] - min(df['capacity'])) / (max(df['capacity']) - min(df['capacity']))
-        if logit:
-            df['relative'].apply(lambda x: 1.0 / (1.0 + 2.0 * math.exp(x - 0.5)))
-    df['size'] = 10
-    if scale is not None:
-        df['size'] = df['relative'] / scale if relative else df['capacity'] / scale
-    for s in sorted(set(df[split])):
-        dfsplit = df.loc[df[split] == s]
+    df = _resolve_frame(df, zoom, legend_string, categorical=(split,))
+    groups = df.groups(split)
+    sizes = df.sizes(scale, relative)
+    text = df.text
+    for i, (label, idx) in enumerate(groups):
+        # one colour per group, spread over the palette
         pt = go.Scattermapbox(
-            lon=dfsplit['lon'],
-            lat=dfsplit['lat'],
-            text=dfsplit['text'] if 'text' in dfsplit.columns else None,
+            lon=df.lon[idx],
+            lat=df.lat[idx],
+            text=text[idx] if text is not None else None,
             marker=go.scattermapbox.Marker(
-                size=dfsplit['size'],
-                color=dfsplit['color'],
+                size=sizes if scale is None else sizes[idx],
+                color=colors[(i * len(colors) // len(groups)) % len(colors)],
                 showscale=False,
                 reversescale=False,
                 sizemode='area',
@@ -145,71 +259,39 @@ def capacity_bubbleplot_multicolor(df, title_string, scale, split='technology',
             line=go.scattermapbox.Line(
                 width=0.5, color='rgb(40,40,40)'
             ),
-            name=dfsplit.iloc[0][split]
+            name=label
         )
         pts.append(pt)
-    layout = go.Layout(
-        title=go.layout.Title(
-            text=title_string
-        ),
-        showlegend=True,
-        # geo = go.layout.Geo(
-        #     scope = 'usa',
-        #     projection = go.layout.geo.Projection(
-        #         type='albers usa'
-        #     ),
-        #     showland = True,
-        #     landcolor = 'rgb(217, 217, 217)',
-        #     subunitwidth=1,
-        #     countrywidth=1,
-        #     subunitcolor="rgb(255, 255, 255)",
-        #     countrycolor="rgb(255, 255, 255)"
-        # )
-        mapbox=go.layout.Mapbox(
-            accesstoken=MAPBOX_ACCESS_TOKEN,
-            bearing=0,
-            center=go.layout.mapbox.Center(
-                lat=38,
-                lon=-94
-            ),
-            pitch=0,
-            zoom=3,
-            # style='light'
-        ),
-        autosize=True,
-        hovermode='closest'
-    )
+    layout = map_layout(title_string, zoom)
 
     fig = go.Figure(data=pts, layout=layout)
 
-    if show: py.plot(fig, filename=re.sub(r'[\s/]+', '-', title_string) if filename is None else filename)
+    if show: render(fig, figure_name(title_string, filename), backend)
     return fig
 
 
+@timed('plot_data.capacity_bubbleplot_multi')
 def capacity_bubbleplot_multi(dfs, title_string, scales, colors=['rgb(0,116,217)'], filename=None, show=True,
-                              legend_strings=['Capacity'], relative=[False], logit=False):
+                              legend_strings=['Capacity'], relative=[False], logit=False, zoom=3,
+                              backend=None):
+    import plotly.graph_objs as go
     pts = []
     for i, df in enumerate(dfs):
-        if relative[i % len(relative)]:
-            df['relative'] = (df['capacity'] - min(df['capacity'])) / (max(df['capacity']) - min(df['capacity']))
-            if logit:
-                df['relative'].apply(lambda x: 1.0 / (1.0 + 2.0 * math.exp(x - 0.5)))
-        sz = 10
-        if scales[i % len(scales)] is not None:
-            sz = df['relative'] / scales[i % len(scales)] if relative[i % len(relative)] else df['capacity'] / scales[
-                i % len(scales)]
+        df = _resolve_frame(df, zoom, legend_strings[i % len(legend_strings)])
+        color = colors[i % len(colors)]
+        lon, lat = df.jittered()
         pt = go.Scattermapbox(
-            lon=df['lon'] + 0.005 * np.random.randn(len(df)),  # add jitter
-            lat=df['lat'] + 0.005 * np.random.randn(len(df)),
-            text=df['text'] if 'text' in df.columns else None,
+            lon=lon,
+            lat=lat,
+            text=df.text,
             marker=go.scattermapbox.Marker(
-                size=sz,
-                color=colors[i % len(colors)] if re.match(r'rgb\(.*\)', colors[i % len(colors)]) else df['capacity'],
-                colorscale=colors[i % len(colors)] if not re.match(r'rgb\(.*\)', colors[i % len(colors)]) else None,
-                reversescale=True if colors[i % len(colors)] in {'Greens'} else False,
+                size=df.sizes(scales[i % len(scales)], relative[i % len(relative)]),
+                color=color if _is_rgb(color) else df.capacity,
+                colorscale=color if not _is_rgb(color) else None,
+                reversescale=True if color in {'Greens'} else False,
                 # showscale=True if gradients is not None else False,
                 sizemode='area',
-                opacity=0.5 if re.match(r'rgb\(.*\)', colors[i % len(colors)]) else 0.8,
+                opacity=0.5 if _is_rgb(color) else 0.8,
                 sizemin=1
             ),
             line=go.scattermapbox.Line(
@@ -218,108 +300,162 @@ def capacity_bubbleplot_multi(dfs, title_string, scales, colors=['rgb(0,116,217)
             name=legend_strings[i % len(legend_strings)]
         )
         pts.append(pt)
-    # layout = go.Layout(
-    #     title=go.layout.Title(
-    #         text=title_string
-    #     ),
-    #     showlegend=True,
-    #     geo=go.layout.Geo(
-    #         scope='usa',
-    #         projection=go.layout.geo.Projection(
-    #             type='albers usa'
-    #         ),
-    #         showland=True,
-    #         landcolor='rgb(217, 217, 217)',
-    #         subunitwidth=1,
-    #         countrywidth=1,
-    #         subunitcolor="rgb(255, 255, 255)",
-    #         countrycolor="rgb(255, 255, 255)"
-    #     )
-    layout = go.Layout(
-        title=go.layout.Title(
-            text=title_string
-        ),
-        showlegend=True,
-        mapbox=go.layout.Mapbox(
-            accesstoken=MAPBOX_ACCESS_TOKEN,
-            bearing=0,
-            center=go.layout.mapbox.Center(
-                lat=38,
-                lon=-94
-            ),
-            pitch=0,
-            zoom=3,
-            # style='light'
+    layout = map_layout(title_string, zoom)
+
+    fig = go.Figure(data=pts, layout=layout)
+    if show: render(fig, figure_name(title_string, filename), backend)
+    return fig
+
+
+def grid_image_uri(grid, colorscale='Reds', vmin=None, vmax=None):
+    '''
+    Renders a Grid as a base64 PNG data URI for a mapbox image layer; empty cells are transparent
+    :return: (data URI, vmin, vmax)
+    '''
+    import matplotlib.pyplot as plt
+    image = mercator_image(grid)
+    vmin = np.nanmin(image) if vmin is None else vmin
+    vmax = np.nanmax(image) if vmax is None else vmax
+    norm = (image - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(image)
+    rgba = plt.get_cmap(colorscale)(np.nan_to_num(norm))
+    rgba[np.isnan(image), 3] = 0.0
+    buf = io.BytesIO()
+    plt.imsave(buf, rgba, format='png')
+    return 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii'), vmin, vmax
+
+
+@timed('plot_data.capacity_gridplot')
+def capacity_gridplot(grid, title_string, colorscale='Reds', filename=None, show=True, legend_string='Capacity',
+                      opacity=0.7, zoom=3, backend=None):
+    '''
+    Plots a Grid (see gridding.rasterize) as one image layer, so the figure size depends on the
+    grid resolution rather than the number of points
+    '''
+    import plotly.graph_objs as go
+    source, vmin, vmax = grid_image_uri(grid, colorscale)
+    lat0, lat1 = float(grid.lat_edges[0]), float(grid.lat_edges[-1])
+    lon0, lon1 = float(grid.lon_edges[0]), float(grid.lon_edges[-1])
+    # invisible two-point trace, only there to draw the colour scale
+    pt = go.Scattermapbox(
+        lon=[(lon0 + lon1) / 2] * 2,
+        lat=[(lat0 + lat1) / 2] * 2,
+        mode='markers',
+        hoverinfo='skip',
+        marker=go.scattermapbox.Marker(
+            size=0,
+            opacity=0,
+            color=[vmin, vmax],
+            colorscale=colorscale,
+            showscale=True
         ),
-        autosize=True,
-        hovermode='closest'
+        name=legend_string
     )
+    layout = map_layout(title_string, zoom, showlegend=False)
+    layout.mapbox.layers = [dict(
+        sourcetype='image',
+        source=source,
+        coordinates=[[lon0, lat1], [lon1, lat1], [lon1, lat0], [lon0, lat0]],
+        opacity=opacity,
+        below='traces'
+    )]
 
-    fig = go.Figure(data=pts, layout=layout)
-    if show: py.plot(fig, filename=re.sub(r'[\s/]+', '-', title_string) if filename is None else filename)
+    fig = go.Figure(data=[pt], layout=layout)
+    if show: render(fig, figure_name(title_string, filename), backend)
+    return fig
+
+
+@timed('plot_data.capacity_histograms')
+def capacity_histograms(dfs, titles, xlabels, hist_colors, filename=None, show=True, output_dir=None, bins=20):
+    '''
+    Side-by-side matplotlib histograms of the capacity column of each dataframe
+    :param filename: if given, save the panel as filename.png in output_dir
+    :return: matplotlib figure
+    '''
+    import matplotlib.pyplot as plt
+    style = 'seaborn' if 'seaborn' in plt.style.available else 'seaborn-v0_8'
+    with plt.style.context(style):
+        fig = plt.figure()
+        for i, df in enumerate(dfs):
+            plt.subplot(1, len(dfs), i + 1)
+            plt.hist(df.capacity if isinstance(df, PreparedFrame) else df['capacity'], color=hist_colors[i], bins=bins)
+            plt.xlabel(xlabels[i])
+            plt.ylabel('Frequency')
+            plt.title(titles[i])
+        if filename is not None:
+            output_dir = DEFAULT_OUTPUT_DIR if output_dir is None else output_dir
+            os.makedirs(output_dir, exist_ok=True)
+            fig.savefig(os.path.join(output_dir, filename + '.png'))
+        if show:
+            plt.show()
     return fig
 
 
+def figure_specs():
+    '''
+    Specs of the standard figure set for batch_render.render_batch, over frames named pp, solar and wind
+    '''
+    solar_lod = {'frame': 'solar', 'lod': {'max_points': 5000}}
+    wind_lod = {'frame': 'wind', 'lod': {'max_points': 5000}}
+    return [
+        {'func': 'capacity_bubbleplot_multicolor', 'data': 'pp', 'args': ('Power Plant Capacities in MW By Type', 10),
+         'kwargs': {'legend_string': 'Power Plant Capacity'}},
+        {'func': 'capacity_bubbleplot', 'data': 'solar', 'args': ('Solar Capacities in kWh/m^2/day', 0.0035),
+         'kwargs': {'legend_string': 'Solar Capacity', 'color': 'rgb(250,194,5)', 'relative': True, 'logit': True}},
+        {'func': 'capacity_bubbleplot', 'data': solar_lod, 'args': ('Solar Capacities in kWh/m^2/day', None),
+         'kwargs': {'legend_string': 'Solar Capacity', 'color': 'Reds', 'filename': 'Gradient-Solar-Capacities'}},
+        {'func': 'capacity_gridplot', 'data': {'frame': 'solar', 'grid': {'resolution': 0.25, 'idw': {'max_km': 50}}},
+         'args': ('Solar Capacities in kWh/m^2/day',),
+         'kwargs': {'legend_string': 'Solar Capacity', 'colorscale': 'Reds', 'filename': 'Grid-Solar-Capacities'}},
+        {'func': 'capacity_bubbleplot', 'data': 'wind', 'args': ('Wind Capacity Factors', 0.01),
+         'kwargs': {'legend_string': 'Wind Capacity', 'color': 'rgb(45,249,5)', 'relative': True, 'logit': True}},
+        {'func': 'capacity_bubbleplot', 'data': wind_lod, 'args': ('Wind Capacity Factors', None),
+         'kwargs': {'legend_string': 'Wind Capacity', 'color': 'Greens', 'filename': 'Gradient-Wind-Capacities'}},
+        {'func': 'capacity_bubbleplot_multi', 'data': [solar_lod, wind_lod, 'pp'],
+         'args': ('Wind and Solar Capacity Factors with Power Plant Capacities', [None, None, 10]),
+         'kwargs': {'legend_strings': ['Solar Capacity Factor', 'Wind Capacity Factor', 'Power Plant Capacities'],
+                    'colors': ['Reds', 'Greens', 'rgb(0,116,217)']}},
+        {'func': 'capacity_bubbleplot_multi',
+         'data': [{'frame': 'solar', 'top': ('capacity', 100)},
+                  {'frame': 'wind', 'top': ('capacity', 100)},
+                  {'frame': 'pp', 'query': 'capacity >= 100.0'}],
+         'args': ('Limited Wind and Solar Capacity Factors with Power Plant Capacities', [0.05, 0.225, 20]),
+         'kwargs': {'legend_strings': ['Solar Capacity Factor', 'Wind Capacity Factor', 'Power Plant Capacities'],
+                    'colors': ['rgb(250,194,5)', 'rgb(45,249,5)', 'rgb(0,116,217)']}},
+        {'func': 'capacity_histograms', 'data': ['pp', 'solar', 'wind'],
+         'args': (['Histogram of Power Plant Capacity', 'Histogram of Solar Capacity', 'Histogram of Wind Capacity Factors'],
+                  ['Capacity (MW)', 'Capacity (kW/m^2/hr)', 'Capacity Factor'],
+                  ['b', 'r', 'g'])},
+    ]
+
+
 if __name__ == '__main__':
-    pp = extract_power_plant_capacities('../data/december_generator2017.xlsx')
+    from batch_render import render_batch
+
+    import pandas as pd
+    sites = ingest_sources({'plants': ('plants', '../data/december_generator2017.xlsx'),
+                            'wind_west': ('wind', '../data/nrel-west_wind_site_metadata.json', {'region': 'west'}),
+                            'wind_east': ('wind', '../data/nrel-east_wind_site_metadata.json', {'region': 'east'})},
+                           cache_dir=DEFAULT_CACHE_DIR)
+    pp = sites.loc[sites['source'] == 'plants', ['lat', 'lon', 'capacity', 'name']].reset_index(drop=True)
     pp['text'] = pp['name'] + '<br>Production Capacity: ' + pp['capacity'].map('{:.1f}'.format) + ' MW'
     pp['technology'] = pp['name'].map(lambda x: re.match(r'.*\((.*)\)', x).group(1))
-
-
     print(pp)
-    capacity_bubbleplot_multicolor(pp, 'Power Plant Capacities in MW By Type', 10, legend_string='Power Plant Capacity')
 
-    solar = pd.read_csv('../data/solar_capacities_ghi_nozeros.csv', index_col=0)
+    solar = load_solar_capacities('../data/solar_capacities_ghi_nozeros.csv', cache_dir=DEFAULT_CACHE_DIR)
     solar = limit_df_coordinates(solar, 4)
     solar['text'] = 'Global Horizontal Irradiance: ' + solar['capacity'].map('{:.1f}'.format) + ' kWh/m^2/day'
     # solar['text'] = 'Direct Normal Irradiance: ' + solar['capacity'].map('{:.1f}'.format) + ' kWh/m^2/day'
-    capacity_bubbleplot(solar, 'Solar Capacities in kWh/m^2/day', 0.0035, legend_string='Solar Capacity', color='rgb(250,194,5)', relative=True, logit=True)
-    capacity_bubbleplot(solar, 'Solar Capacities in kWh/m^2/day', None, legend_string='Solar Capacity', color='Reds', filename='Gradient-Solar-Capacities')
 
-    windW = extract_wind_capacities('../data/nrel-west_wind_site_metadata.json', region='west')
-    windE = extract_wind_capacities('../data/nrel-east_wind_site_metadata.json', region='east')
-    factor = determine_wind_scaling_factor(windW, windE)
+    windW = sites.loc[sites['source'] == 'wind_west', ['lat', 'lon', 'capacity']].reset_index(drop=True)
+    windE = sites.loc[sites['source'] == 'wind_east', ['lat', 'lon', 'capacity']].reset_index(drop=True)
+    estimate = bootstrap_wind_scaling_factor(windW, windE)
+    print('East wind scaling factor {factor:.3f} (95% CI {low:.3f}-{high:.3f}, {cells} cells)'.format(**estimate))
+    factor = estimate['factor']
     windE['capacity'] *= factor
-    wind = limit_df_coordinates(windW.append(windE), precision=4)
+    wind = limit_df_coordinates(pd.concat([windW, windE], ignore_index=True), precision=4)
     wind['text'] = 'Capacity Factor: ' + wind['capacity'].map('{:.2f}'.format)
-    capacity_bubbleplot(wind, 'Wind Capacity Factors', 0.01, legend_string='Wind Capacity',
-                        color='rgb(45,249,5)', relative=True, logit=True)
-    capacity_bubbleplot(wind, 'Wind Capacity Factors', None, legend_string='Wind Capacity',
-                        color='Greens', filename='Gradient-Wind-Capacities')
-
-    capacity_bubbleplot_multi([solar, wind, pp], 'Wind and Solar Capacity Factors with Power Plant Capacities', [None, None, 10],
-                              legend_strings=['Solar Capacity Factor', 'Wind Capacity Factor', 'Power Plant Capacities'],
-                              colors=['Reds', 'Greens', 'rgb(0,116,217)'])
-
-    capacity_bubbleplot_multi(
-        [solar.sort_values('capacity', ascending=False).head(100),
-         wind.sort_values('capacity', ascending=False).head(100),
-         pp.loc[pp['capacity'] >= 100.0]],
-        'Limited Wind and Solar Capacity Factors with Power Plant Capacities',
-        [0.05, 0.225, 20],
-        legend_strings=['Solar Capacity Factor', 'Wind Capacity Factor', 'Power Plant Capacities'],
-        colors=['rgb(250,194,5)', 'rgb(45,249,5)', 'rgb(0,116,217)'])
-
-    with plt.style.context('seaborn'):
-
-        plt.figure()
-
-        plt.subplot(1,3,1)
-        plt.hist(pp['capacity'], color='b', bins=20)
-        plt.xlabel('Capacity (MW)')
-        plt.ylabel('Frequency')
-        plt.title('Histogram of Power Plant Capacity')
-
-        plt.subplot(1, 3, 2)
-        plt.hist(solar['capacity'], color='r', bins=20)
-        plt.xlabel('Capacity (kW/m^2/hr)')
-        plt.ylabel('Frequency')
-        plt.title('Histogram of Solar Capacity')
-
-        plt.subplot(1, 3, 3)
-        plt.hist(wind['capacity'], color='g', bins=20)
-        plt.xlabel('Capacity Factor')
-        plt.ylabel('Frequency')
-        plt.title('Histogram of Wind Capacity Factors')
-
-        plt.show()
+
+    specs = figure_specs()
+    for result in render_batch(specs, {'pp': pp, 'solar': solar, 'wind': wind}):
+        print(result)
+    write_metrics()
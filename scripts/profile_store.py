@@ -0,0 +1,201 @@
+import json
+import os
+import warnings
+import numpy as np
+from geohash import encode_int_many, truncate_int, int_to_geohash
+from instrumentation import timed
+
+HOURS = 8760
+# first hour of every month in a non-leap 8760 hour year, plus the end of the year
+MONTH_EDGES = np.cumsum([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]) * 24
+MONTHS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+
+class ProfileStore:
+    '''
+    Hourly profiles (e.g. capacity factors) of many sites as one sites x hours float32 matrix in a .npy
+    file, memory-mapped so that rows (sites) and columns (hours) are sliced without reading the rest.
+    Row i belongs to row i of the lat/lon frame the store was created from, such as the output of
+    extract_wind_capacities or query_solar_capacities. Aggregations read chunk_sites rows at a time.
+    :param path: directory holding profiles.npy, sites.npz and meta.json
+    :param mode: 'r' to read, 'r+' to also write profiles
+    '''
+
+    def __init__(self, path, mode='r'):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.profiles = np.load(os.path.join(path, 'profiles.npy'), mmap_mode=mode)
+        with np.load(os.path.join(path, 'sites.npz')) as f:
+            self.lat, self.lon, self.keys = f['lat'], f['lon'], f['keys']
+
+    @classmethod
+    def create(cls, path, lat, lon, hours=HOURS, precision=8, fill=np.nan):
+        '''
+        Creates an empty store for the given sites
+        :param precision: geohash precision of the stored site keys; cells for aggregation may be coarser
+        :return: ProfileStore opened for writing
+        '''
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        os.makedirs(path, exist_ok=True)
+        profiles = np.lib.format.open_memmap(os.path.join(path, 'profiles.npy'), mode='w+', dtype=np.float32,
+                                             shape=(len(lat), hours))
+        profiles[:] = fill
+        profiles.flush()
+        del profiles
+        np.savez(os.path.join(path, 'sites.npz'), lat=lat, lon=lon, keys=encode_int_many(lat, lon, precision))
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'hours': hours, 'precision': precision}, f)
+        return cls(path, mode='r+')
+
+    @classmethod
+    def from_frame(cls, path, df, **kwargs):
+        '''
+        Creates an empty store with one row per row of a lat/lon dataframe
+        '''
+        return cls.create(path, df['lat'].values, df['lon'].values, **kwargs)
+
+    def __len__(self):
+        return self.profiles.shape[0]
+
+    @property
+    def hours(self):
+        return self.profiles.shape[1]
+
+    def flush(self):
+        self.profiles.flush()
+
+    def _chunks(self, chunk_sites):
+        for start in range(0, len(self), chunk_sites):
+            yield start, min(start + chunk_sites, len(self))
+
+    def fill(self, func, chunk_sites=1024):
+        '''
+        Writes profiles chunk by chunk
+        :param func: function(lat, lon) returning a (len(lat), hours) array of profiles for those sites
+        '''
+        for start, stop in self._chunks(chunk_sites):
+            self.profiles[start:stop] = func(self.lat[start:stop], self.lon[start:stop])
+        self.flush()
+
+    def rows_at(self, lat, lon):
+        '''
+        Row of the site at each location (matched on the stored geohash key), or -1
+        '''
+        keys = encode_int_many(np.atleast_1d(np.asarray(lat, dtype=np.float64)),
+                               np.atleast_1d(np.asarray(lon, dtype=np.float64)), self.meta['precision'])
+        if len(self) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        order = np.argsort(self.keys, kind='stable')
+        pos = np.minimum(np.searchsorted(self.keys[order], keys), len(order) - 1)
+        return np.where(self.keys[order][pos] == keys, order[pos], -1)
+
+    @timed('profile_store.annual_means')
+    def annual_means(self, chunk_sites=1024):
+        '''
+        Mean over all hours that are not NaN per site, comparable with the annual scalars of the site frames
+        '''
+        out = np.empty(len(self), dtype=np.float32)
+        for start, stop in self._chunks(chunk_sites):
+            with warnings.catch_warnings():
+                # sites without any values get NaN, as in the other aggregations
+                warnings.simplefilter('ignore', RuntimeWarning)
+                out[start:stop] = np.nanmean(self.profiles[start:stop], axis=1)
+        return out
+
+    @timed('profile_store.monthly_means')
+    def monthly_means(self, chunk_sites=1024):
+        '''
+        :return: (sites, 12) float32 array of monthly means over the hours that are not NaN
+        '''
+        if self.hours != HOURS:
+            raise ValueError('Monthly means need {} hour profiles'.format(HOURS))
+        out = np.empty((len(self), 12), dtype=np.float32)
+        for start, stop in self._chunks(chunk_sites):
+            out[start:stop] = _nanmean_reduceat(self.profiles[start:stop], MONTH_EDGES[:-1], axis=1)
+        return out
+
+    @timed('profile_store.percentiles')
+    def percentiles(self, q=(10, 50, 90), chunk_sites=1024):
+        '''
+        :return: (sites, len(q)) float32 array of percentiles over the hours that are not NaN of each site
+        '''
+        q = np.atleast_1d(q)
+        out = np.empty((len(self), len(q)), dtype=np.float32)
+        for start, stop in self._chunks(chunk_sites):
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                out[start:stop] = np.nanpercentile(self.profiles[start:stop], q, axis=1).T
+        return out
+
+    def cell_runs(self, precision):
+        '''
+        Groups sites by geohash cell
+        :return: (sorted cell keys, site rows ordered by cell, start and stop of each cell's run in that order)
+        '''
+        keys = truncate_int(self.keys, precision)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        return sorted_keys[starts], order, starts, np.r_[starts[1:], len(order)]
+
+
+def _nanmean_reduceat(values, offsets, axis):
+    '''
+    Means of the slices np.add.reduceat would sum, ignoring NaN like np.nanmean; NaN for all-NaN slices
+    '''
+    missing = np.isnan(values)
+    sums = np.add.reduceat(np.where(missing, 0, values), offsets, axis=axis, dtype=np.float64)
+    counts = np.add.reduceat(~missing, offsets, axis=axis, dtype=np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts
+
+
+def _cell_mean_profiles(store, order, starts, stops):
+    '''
+    Mean profile of each run of rows, ignoring NaN; reads only the rows of these runs
+    '''
+    rows = np.concatenate([order[a:b] for a, b in zip(starts, stops)])
+    block = store.profiles[np.sort(rows)]
+    # rows were read in file order; put them back in run order
+    block = block[np.argsort(np.argsort(rows, kind='stable'), kind='stable')]
+    offsets = np.r_[0, np.cumsum(stops - starts)[:-1]]
+    return _nanmean_reduceat(block, offsets, axis=0)
+
+
+@timed('profile_store.cell_correlation')
+def cell_correlation(wind, solar, precision=4, chunk_sites=1024):
+    '''
+    Pearson correlation over the hours of the year between the mean wind and mean solar profile of
+    every geohash cell holding sites of both stores, using the hours that are not NaN in either
+    profile. Cells are processed in batches of about chunk_sites sites per store.
+    :param wind: ProfileStore
+    :param solar: ProfileStore with the same number of hours
+    :return: dataframe of geohash, correlation, wind_sites and solar_sites per shared cell
+    '''
+    import pandas as pd
+    if wind.hours != solar.hours:
+        raise ValueError('Stores hold profiles of different lengths')
+    wcells, worder, wstarts, wstops = wind.cell_runs(precision)
+    scells, sorder, sstarts, sstops = solar.cell_runs(precision)
+    cells, wi, si = np.intersect1d(wcells, scells, assume_unique=True, return_indices=True)
+    wcount, scount = wstops[wi] - wstarts[wi], sstops[si] - sstarts[si]
+    correlation = np.empty(len(cells))
+    cumulative = np.cumsum(np.maximum(wcount, scount))
+    start = 0
+    while start < len(cells):
+        base = cumulative[start - 1] if start else 0
+        stop = max(start + 1, int(np.searchsorted(cumulative, base + chunk_sites, side='right')))
+        w = _cell_mean_profiles(wind, worder, wstarts[wi[start:stop]], wstops[wi[start:stop]])
+        s = _cell_mean_profiles(solar, sorder, sstarts[si[start:stop]], sstops[si[start:stop]])
+        # only hours known on both sides count
+        valid = ~(np.isnan(w) | np.isnan(s))
+        n = valid.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            w = np.where(valid, w - np.where(valid, w, 0).sum(axis=1, keepdims=True) / n, 0)
+            s = np.where(valid, s - np.where(valid, s, 0).sum(axis=1, keepdims=True) / n, 0)
+            correlation[start:stop] = (w * s).sum(axis=1) / np.sqrt((w * w).sum(axis=1) * (s * s).sum(axis=1))
+        start = stop
+    return pd.DataFrame({'geohash': int_to_geohash(cells), 'correlation': correlation,
+                         'wind_sites': wcount, 'solar_sites': scount})
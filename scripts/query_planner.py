@@ -0,0 +1,126 @@
+import heapq
+import numpy as np
+from geohash import encode_int_many, truncate_int, int_to_geohash, decode_many
+from instrumentation import METRICS, record_dedup
+
+
+def _children(skeys, precision, lo, hi):
+    '''
+    (lo, hi) slices of the sorted keys that fall in each occupied child at precision + 1
+    '''
+    child_keys = truncate_int(skeys[lo:hi], precision + 1)
+    starts = np.flatnonzero(np.r_[True, child_keys[1:] != child_keys[:-1]]) + lo
+    return list(zip(starts.tolist(), np.r_[starts[1:], hi].tolist()))
+
+
+def _merge_sparsest(skeys, cells, precision, budget):
+    '''
+    Merges the sibling groups of cells at precision holding the fewest points into their parents
+    until at most budget cells remain; if merging every group is not enough, all cells move to the parents
+    :param cells: list of (precision, lo, hi) slices of the sorted keys, in key order
+    '''
+    parents = truncate_int(skeys[[lo for _, lo, _ in cells]], precision - 1)
+    starts = np.flatnonzero(np.r_[True, parents[1:] != parents[:-1]])
+    stops = np.r_[starts[1:], len(cells)]
+    points = [cells[b - 1][2] - cells[a][1] for a, b in zip(starts, stops)]
+    excess, merged = len(cells) - budget, set()
+    for g in np.argsort(points, kind='stable').tolist():
+        if excess <= 0:
+            break
+        if stops[g] - starts[g] > 1:
+            merged.add(g)
+            excess -= stops[g] - starts[g] - 1
+    out = []
+    for g, (a, b) in enumerate(zip(starts.tolist(), stops.tolist())):
+        if g in merged or excess > 0:
+            out.append((precision - 1, cells[a][1], cells[b - 1][2]))
+        else:
+            out.extend(cells[a:b])
+    return out
+
+
+def plan_cells(lat, lon, budget, min_precision=2, max_precision=6):
+    '''
+    Picks query cells of varying geohash precision for at most budget requests. Starting from the
+    occupied cells at min_precision, the cell holding the most points is repeatedly split into its
+    occupied children while the split fits in the budget, so dense regions get small cells and sparse
+    regions stay coarse. A cell whose points all fall in one child is narrowed for free. If more
+    cells are occupied at min_precision than the budget allows, the sparsest sibling cells are first
+    merged into their parents, down to precision 1.
+    :param lat: array of point latitudes
+    :param lon: array of point longitudes
+    :param budget: maximum number of cells (API requests)
+    :param min_precision: precision of the coarsest cells, unless the budget needs coarser ones
+    :param max_precision: precision cells are never split beyond; 6 (about 1.2 x 0.6 km) is already
+                          finer than the 4 km grid behind the NREL solar resource data
+    :return: (uint64 cell keys (see geohash.encode_int_many), index into the cells for every point)
+    '''
+    keys = encode_int_many(np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64), max_precision)
+    order = np.argsort(keys, kind='stable')
+    skeys = keys[order]
+    if len(skeys) == 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    # the sorted keys of every cell form one contiguous run, so a cell is a (lo, hi) slice
+    top = truncate_int(skeys, min_precision)
+    starts = np.flatnonzero(np.r_[True, top[1:] != top[:-1]])
+    cells = list(zip([min_precision] * len(starts), starts.tolist(), np.r_[starts[1:], len(skeys)].tolist()))
+    precision = min_precision
+    while len(cells) > budget and precision > 1:
+        cells = _merge_sparsest(skeys, cells, precision, budget)
+        precision -= 1
+    if len(cells) > budget:
+        raise ValueError('{} cells are occupied at precision {}, more than the budget of {}'.format(
+            len(cells), precision, budget))
+    heap = [(lo - hi, lo, precision, hi) for precision, lo, hi in cells]
+    heapq.heapify(heap)
+    count, leaves = len(heap), []
+    while heap:
+        negative, lo, precision, hi = heapq.heappop(heap)
+        if precision >= max_precision:
+            leaves.append((precision, lo, hi))
+            continue
+        children = _children(skeys, precision, lo, hi)
+        if count + len(children) - 1 > budget:
+            leaves.append((precision, lo, hi))
+            continue
+        count += len(children) - 1
+        for clo, chi in children:
+            heapq.heappush(heap, (clo - chi, clo, precision + 1, chi))
+    leaves.sort(key=lambda leaf: leaf[1])
+    precisions = np.array([p for p, _, _ in leaves])
+    firsts = skeys[[lo for _, lo, _ in leaves]]
+    cell_keys = np.empty(len(leaves), dtype=np.uint64)
+    for precision in np.unique(precisions):
+        sel = precisions == precision
+        cell_keys[sel] = truncate_int(firsts[sel], int(precision))
+    sorted_cell = np.repeat(np.arange(len(leaves)), [hi - lo for _, lo, hi in leaves])
+    point_cell = np.empty(len(keys), dtype=np.int64)
+    point_cell[order] = sorted_cell
+    return cell_keys, point_cell
+
+
+def plan_coordinates(coordinates, budget, min_precision=2, max_precision=6):
+    '''
+    Drop-in for read_data.limit_coordinates with a request budget instead of a fixed precision
+    :param coordinates: list of (lat, lon) tuples
+    :param budget: maximum number of query cells
+    :return: (list of (lat, lon, geohash of the point's query cell), dict of geohash -> query point)
+    '''
+    coordinates = list(coordinates)
+    lats = np.array([c[0] for c in coordinates], dtype=np.float64)
+    lons = np.array([c[1] for c in coordinates], dtype=np.float64)
+    cell_keys, point_cell = plan_cells(lats, lons, budget, min_precision, max_precision)
+    codes = int_to_geohash(cell_keys)
+    hashes = list(zip(lats.tolist(), lons.tolist(), codes[point_cell].tolist()))
+    hashdict = dict(zip(codes.tolist(), zip(*[a.tolist() for a in decode_many(codes)])))
+    record_dedup('query_planner.plan_coordinates', len(hashes), len(hashdict))
+    METRICS.gauge('query_planner.budget', budget)
+    return hashes, hashdict
+
+
+def plan_summary(hashdict):
+    '''
+    Number of planned query cells per geohash precision
+    '''
+    precisions, counts = np.unique([len(h) for h in hashdict], return_counts=True)
+    return dict(zip(precisions.tolist(), counts.tolist()))
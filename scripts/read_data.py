@@ -1,43 +1,165 @@
-import pandas as pd
-import requests
-import geojson
-import time as tm
-import statistics
-from geohash import decode_exactly, decode, encode
+import numpy as np
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataset_cache import cached_frame, DEFAULT_CACHE_DIR
+from geojson_stream import read_point_features
+from instrumentation import METRICS, timed, record_dedup, write_metrics
+from geohash import decode_exactly, decode, encode, decode_many, encode_int_many, int_to_geohash, truncate_int
+from nrel import fetch_solar_resources, SOLAR_RESOURCE_URL, HOURLY_LIMIT, PER_SECOND_LIMIT
+from query_planner import plan_coordinates, plan_summary
+from response_cache import ResponseCache, open_cache
+from solar_store import solar_resource_table, lookup_solar_values
 
-def extract_wind_capacities(filename, region='east'):
+@timed('read_data.extract_wind_capacities')
+def extract_wind_capacities(filename, region='east', chunk_rows=65536, cache_dir=None):
     '''
-    Reads GeoJSON file and extracts wind capacities
+    Streams a GeoJSON file and extracts wind capacities
     :param filename: string of filename
+    :param region: 'east' files carry net_capacity_factor, 'west' files capacity_factor;
+                   the other property is used for features that lack the preferred one
+    :param chunk_rows: rows the output arrays grow by
+    :param cache_dir: directory to cache the parsed dataframe in, or None to always parse
     :return: dataframe of scaled wind capacities
     '''
-    capstr = 'net_capacity_factor'
+    return cached_frame(_parse_wind_capacities, filename, cache_dir, region=region, chunk_rows=chunk_rows)
+
+
+def _parse_wind_capacities(filename, region='east', chunk_rows=65536):
+    import pandas as pd
+    capstrs = ['net_capacity_factor', 'capacity_factor']
     if region == 'west':
-        capstr = 'capacity_factor'
-    with open(filename, 'r') as f:
-        s = f.read()
-        j = geojson.loads(s)
-    data = [(e['geometry']['coordinates'][1], e['geometry']['coordinates'][0], e['properties'][capstr])
-            for e in j.features if isinstance(e, geojson.feature.Feature)]
-    return pd.DataFrame.from_records(data, columns=['lat', 'lon', 'capacity'])
+        capstrs.reverse()
+    lat, lon, capacity = read_point_features(filename, capstrs, chunk_rows=chunk_rows)
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'capacity': capacity})
 
 
-def extract_power_plant_capacities(filename):
+@timed('read_data.extract_power_plant_capacities')
+def extract_power_plant_capacities(filename, technology=None, status=None, min_mw=None, cache_dir=None):
+    '''
+    Reads the EIA-860M generator workbook and sums nameplate capacity per plant
+    :param filename: string of filename
+    :param technology: technology name or collection of names to keep, if given
+    :param status: status or collection of statuses to keep, either full ('(OP) Operating') or code ('OP')
+    :param min_mw: drop generators with nameplate capacity below this, if given
+    :param cache_dir: directory to cache the parsed dataframe in, or None to always parse
+    :return: dataframe of plant capacities
+    '''
+    return cached_frame(_parse_power_plant_capacities, filename, cache_dir, technology=technology, status=status,
+                        min_mw=min_mw)
+
+
+def _parse_power_plant_capacities(filename, technology=None, status=None, min_mw=None):
+    import pandas as pd
     x = pd.read_excel(filename, sheet_name=0, header=1)
     x.columns = map(lambda x: x.strip(), x.columns)
-    data = []
-    for pid in set(x['Plant ID']):
-        try:
-            df = x.loc[x['Plant ID'] == pid, ['Latitude', 'Longitude', 'Nameplate Capacity (MW)', 'Plant Name', 'Technology']]
-            data.append((df.iloc[0]['Latitude'], df.iloc[0]['Longitude'], sum(df['Nameplate Capacity (MW)']), df.iloc[0]['Plant Name'] + ' ({})'.format(df.iloc[0]['Technology'])))
-        except IndexError:
-            pass
-    df = pd.DataFrame.from_records(data, columns = ['lat', 'lon', 'capacity', 'name'])
+    df = aggregate_power_plant_capacities(x, technology=technology, status=status, min_mw=min_mw)
     del x
     return df
 
 
-def query_solar_capacities(api_key, coordinates=None, df=None, lat=None, lon=None, time='annual', dtype='avg_dni', hash_precision=5, request=True, delay=0.0, verbose=False):
+@timed('read_data.load_solar_capacities')
+def load_solar_capacities(filename, cache_dir=None):
+    '''
+    Reads a solar capacity CSV as written by query_solar_capacities
+    :param filename: string of filename
+    :param cache_dir: directory to cache the parsed dataframe in, or None to always parse
+    :return: dataframe of solar capacities
+    '''
+    return cached_frame(_parse_solar_capacities, filename, cache_dir)
+
+
+def _parse_solar_capacities(filename):
+    import pandas as pd
+    return pd.read_csv(filename, index_col=0)
+
+
+# loaders ingest_sources can run, by source kind
+SOURCE_LOADERS = {
+    'wind': extract_wind_capacities,
+    'plants': extract_power_plant_capacities,
+    'solar': load_solar_capacities,
+}
+
+
+def _ingest_source(kind, filename, params):
+    return SOURCE_LOADERS[kind](filename, **params)
+
+
+@timed('read_data.ingest_sources')
+def ingest_sources(sources, processes=None, cache_dir=None):
+    '''
+    Parses several sources concurrently in a process pool and merges them into one table, so the
+    ingest takes about as long as the slowest source
+    :param sources: dict of source name -> (kind, filename, loader keyword arguments), kind being a key
+                    of SOURCE_LOADERS, e.g. {'wind_west': ('wind', path, {'region': 'west'})}
+    :param processes: worker processes (default: one per source, at most one per CPU); 1 parses in-process
+    :param cache_dir: dataset cache directory passed on to every loader
+    :return: dataframe of the rows of every source in the given order, with a categorical source column;
+             columns a source lacks are missing on its rows
+    '''
+    import pandas as pd
+    names = list(sources)
+    if not names:
+        raise ValueError('No sources given')
+    unknown = sorted(set(sources[n][0] for n in names) - set(SOURCE_LOADERS))
+    if unknown:
+        raise ValueError('Unknown source kind {}; known: {}'.format(', '.join(unknown), ', '.join(sorted(SOURCE_LOADERS))))
+    jobs = [(sources[n][0], sources[n][1], dict(sources[n][2] if len(sources[n]) > 2 else {}, cache_dir=cache_dir))
+            for n in names]
+    processes = min(processes or os.cpu_count() or 1, max(1, len(jobs)))
+    if processes == 1:
+        frames = [_ingest_source(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            frames = list(pool.map(_ingest_source, *zip(*jobs)))
+    merged = pd.concat(frames, ignore_index=True)
+    merged['source'] = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), [len(f) for f in frames]),
+                                                 categories=names)
+    return merged
+
+
+def _as_set(values):
+    return {values} if isinstance(values, str) else set(values)
+
+
+def aggregate_power_plant_capacities(x, technology=None, status=None, min_mw=None):
+    '''
+    Aggregates a generator sheet to one row per plant, ordered by plant ID: location, name and
+    technology of the plant's first generator and the summed nameplate capacity. Filters are
+    applied to generators before aggregation.
+    :param x: dataframe of the generator sheet with stripped column names
+    :return: dataframe of plant capacities
+    '''
+    import pandas as pd
+    cap = 'Nameplate Capacity (MW)'
+    keep = np.ones(len(x), dtype=bool)
+    if technology is not None:
+        keep &= x['Technology'].isin(_as_set(technology)).values
+    if status is not None:
+        statuses = _as_set(status)
+        codes = x['Status'].astype(str).str.extract(r'^\((\w+)\)', expand=False)
+        keep &= (x['Status'].isin(statuses) | codes.isin(statuses)).values
+    if min_mw is not None:
+        keep &= (x[cap] >= min_mw).values
+    keep &= x['Plant ID'].notna().values
+    if not keep.all():
+        x = x.loc[keep]
+
+    first = x.drop_duplicates('Plant ID').set_index('Plant ID').sort_index()
+    groups = x.groupby('Plant ID', sort=True)
+    # a plain sum() would skip missing capacities; keep them missing as the per-plant sum did
+    capacity = groups[cap].sum().where(~x[cap].isna().groupby(x['Plant ID']).any())
+    return pd.DataFrame({'lat': first['Latitude'].values,
+                         'lon': first['Longitude'].values,
+                         'capacity': capacity.values,
+                         # format() as the per-plant loop did: a missing technology reads '(nan)', not NaN
+                         'name': (first['Plant Name'] + first['Technology'].map(' ({})'.format)).values})
+
+
+@timed('read_data.query_solar_capacities')
+def query_solar_capacities(api_key, coordinates=None, df=None, lat=None, lon=None, time='annual', dtype='avg_dni', hash_precision=5, request=True, delay=0.0, verbose=False, max_workers=8, hourly_limit=HOURLY_LIMIT, per_second_limit=PER_SECOND_LIMIT, url=SOLAR_RESOURCE_URL, cache=None, budget=None):
+    import pandas as pd
     # get the coordinates we need
     data = []
     coords = coordinates
@@ -52,35 +174,88 @@ def query_solar_capacities(api_key, coordinates=None, df=None, lat=None, lon=Non
     if coords is None:
         raise ValueError('Coordinates not given!')
 
-    hashes, hashdict = limit_coordinates(coords, precision=hash_precision)
-    valdict = dict()
-    count = 0
-    if request:
-        for hash, coord in hashdict.items():
-            try:
-                count += 1
-                if verbose and count % 100 == 0:
-                    print('Made {} requests of {}'.format(count, len(hashdict.keys())))
-                qlat,qlon = coord
-                r = requests.get('https://developer.nrel.gov/api/solar/solar_resource/v1.json',
-                                 params={'api_key': api_key, 'lat': qlat, 'lon': qlon})
-                j = r.json()
-                if r.status_code != 200:
-                    raise ValueError(j['error']['message'])
-                valdict[hash] = j['outputs'][dtype][time]
-                tm.sleep(delay)
-            except Exception as e:
-                print(e)
-                pass
-        for lat, lon, hash in hashes:
-            data.append((lat, lon, valdict.get(hash, 0.0)))
+    if budget is None:
+        hashes, hashdict = limit_coordinates(coords, precision=hash_precision)
     else:
-        print('Would make {} requests to NREL API to obtain information for {} datapoints.'.format(len(hashdict.keys()), len(hashes)))
+        # at most budget cells, sized by point density instead of one hash_precision everywhere
+        hashes, hashdict = plan_coordinates(coords, budget)
+        if verbose:
+            print('Planned {} query cells by precision: {}'.format(len(hashdict), plan_summary(hashdict)))
+    own_cache = cache is not None and not isinstance(cache, ResponseCache)
+    cache = open_cache(cache)
+    try:
+        if request:
+            # a fixed delay is honoured as a cap on the per-second rate
+            if delay > 0:
+                per_second_limit = min(per_second_limit, 1.0 / delay) if per_second_limit else 1.0 / delay
+            responses, errors = fetch_solar_resources(api_key, hashdict, max_workers=max_workers, hourly_limit=hourly_limit,
+                                                      per_second_limit=per_second_limit, url=url, cache=cache, verbose=verbose)
+            if cache is not None:
+                cache.report()
+            if errors:
+                print('{} of {} cells failed and will be retried on the next run'.format(len(errors), len(hashdict)))
+            table = solar_resource_table(responses)
+            values = lookup_solar_values(table, [h[2] for h in hashes], dtype, time)
+            data = [(lat, lon, v) for (lat, lon, hash), v in zip(hashes, values.tolist())]
+        else:
+            missing = len(hashdict) if cache is None else sum(1 for h in hashdict if (url, h) not in cache)
+            print('Would make {} requests to NREL API to obtain information for {} datapoints.'.format(missing, len(hashes)))
+    finally:
+        if own_cache:
+            cache.close()
     return pd.DataFrame.from_records(data, columns=['lat', 'lon', 'capacity'])
 
-def save_all_solar_capacities(api_key, filename, coordinates=None, df=None, lat=None, lon=None, request=True, delay=0.0):
+@timed('read_data.refresh_solar_capacities')
+def refresh_solar_capacities(api_key, previous, coordinates=None, df=None, lat=None, lon=None, hash_precision=5,
+                             request=True, **query_args):
+    '''
+    Updates an earlier query_solar_capacities result for a new set of coordinates, querying only the
+    geohash cells the earlier result does not cover. Cells that were missing or zero-filled before
+    (failed requests) are queried again.
+    :param previous: earlier result as a dataframe, or the path of the CSV it was saved to
+    :param hash_precision: geohash precision; must match the one the earlier result was made with
+    :param request: whether to query the new cells; if not, they are left missing in the result
+    :param query_args: further arguments for query_solar_capacities (dtype, time, cache, ...)
+    :return: dataframe of lat, lon and capacity for every new coordinate, in input order
+    '''
+    import pandas as pd
+    if df is not None:
+        lat, lon = df['lat'].values, df['lon'].values
+    elif coordinates is not None:
+        coordinates = list(coordinates)
+        lat, lon = [c[0] for c in coordinates], [c[1] for c in coordinates]
+    if lat is None or lon is None:
+        raise ValueError('Coordinates not given!')
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) != len(lon):
+        raise ValueError('Lat and Lon coord lists are not of equal lengths')
+    if not isinstance(previous, pd.DataFrame):
+        previous = load_solar_capacities(previous)
+    previous = previous[previous['capacity'].fillna(0) != 0]
+    known_cells, first = np.unique(encode_int_many(previous['lat'].values, previous['lon'].values, hash_precision),
+                                   return_index=True)
+    known_values = previous['capacity'].values[first].astype(np.float64)
+
+    keys = encode_int_many(lat, lon, hash_precision)
+    pos = np.minimum(np.searchsorted(known_cells, keys), max(len(known_cells) - 1, 0))
+    known = known_cells[pos] == keys if len(known_cells) else np.zeros(len(keys), dtype=bool)
+    capacity = np.where(known, known_values[pos] if len(known_cells) else np.nan, np.nan)
+    new_cells = len(np.unique(keys[~known]))
+    if query_args.get('verbose'):
+        print('{} of {} cells are known from the previous result; {} new cells to query'.format(
+            len(np.unique(keys[known])), len(np.unique(keys)), new_cells))
+    METRICS.count('read_data.refresh_solar_capacities.cells_reused', len(np.unique(keys[known])))
+    METRICS.count('read_data.refresh_solar_capacities.cells_new', new_cells)
+    if new_cells and request:
+        fresh = query_solar_capacities(api_key, lat=lat[~known], lon=lon[~known], hash_precision=hash_precision,
+                                       **query_args)
+        capacity[~known] = fresh['capacity'].values
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'capacity': capacity})
+
+@timed('read_data.save_all_solar_capacities')
+def save_all_solar_capacities(api_key, filename, coordinates=None, df=None, lat=None, lon=None, request=True, delay=0.0, max_workers=8, hourly_limit=HOURLY_LIMIT, per_second_limit=PER_SECOND_LIMIT, url=SOLAR_RESOURCE_URL, cache=None, budget=None):
     # get the coordinates we need
-    data = []
     coords = coordinates
     if coords is None:
         if df is None:
@@ -93,22 +268,29 @@ def save_all_solar_capacities(api_key, filename, coordinates=None, df=None, lat=
     if coords is None:
         raise ValueError('Coordinates not given!')
 
-    hashes, hashdict = limit_coordinates(coords)
-    valdict = dict()
-    with open(filename, 'w') as f:
-        if request:
-            for hash, coord in hashdict.items():
-                qlat,qlon = coord
-                r = requests.get('https://developer.nrel.gov/api/solar/solar_resource/v1.json',
-                                 params={'api_key': api_key, 'lat': qlat, 'lon': qlon})
-                f.write(r.text + '\n')
-                tm.sleep(delay)
-            for lat, lon, hash in hashes:
-                data.append((lat, lon, valdict[hash]))
-        else:
-            print('Would make {} requests to NREL API to obtain information for {} datapoints.'.format(len(hashdict.keys()), len(hashes)))
+    hashes, hashdict = limit_coordinates(coords) if budget is None else plan_coordinates(coords, budget)
+    if request:
+        if delay > 0:
+            per_second_limit = min(per_second_limit, 1.0 / delay) if per_second_limit else 1.0 / delay
+        own_cache = cache is not None and not isinstance(cache, ResponseCache)
+        cache = open_cache(cache)
+        try:
+            responses, errors = fetch_solar_resources(api_key, hashdict, max_workers=max_workers, hourly_limit=hourly_limit,
+                                                      per_second_limit=per_second_limit, url=url, cache=cache)
+            if cache is not None:
+                cache.report()
+        finally:
+            if own_cache:
+                cache.close()
+        with open(filename, 'w') as f:
+            for hash in hashdict:
+                if hash in responses:
+                    f.write(json.dumps(responses[hash]) + '\n')
+    else:
+        print('Would make {} requests to NREL API to obtain information for {} datapoints.'.format(len(hashdict.keys()), len(hashes)))
 
 
+@timed('read_data.limit_coordinates')
 def limit_coordinates(coordinates, precision=5):
     '''
     Combines coordinates based on geohash precision
@@ -117,10 +299,17 @@ def limit_coordinates(coordinates, precision=5):
     :return:
     '''
 
-    hashes = [(lat, lon, encode(lat, lon, precision)) for lat, lon in coordinates]
-    hashdict = dict([(h, decode(h)) for h in set([h[2] for h in hashes])])
+    coordinates = list(coordinates)
+    lats = np.array([c[0] for c in coordinates], dtype=np.float64)
+    lons = np.array([c[1] for c in coordinates], dtype=np.float64)
+    keys, inverse = np.unique(encode_int_many(lats, lons, precision), return_inverse=True)
+    unique_codes = int_to_geohash(keys)
+    hashes = list(zip(lats.tolist(), lons.tolist(), unique_codes[inverse.ravel()].tolist()))
+    hashdict = dict(zip(unique_codes.tolist(), zip(*[a.tolist() for a in decode_many(unique_codes)])))
+    record_dedup('read_data.limit_coordinates', len(hashes), len(hashdict))
     return hashes, hashdict
 
+@timed('read_data.limit_df_coordinates')
 def limit_df_coordinates(df, precision=5):
     '''
     Combines coordinates based on geohash precision
@@ -128,47 +317,194 @@ def limit_df_coordinates(df, precision=5):
     :param precision: geohash precision
     :return:
     '''
+    import pandas as pd
+    keys = encode_int_many(df['lat'].values, df['lon'].values, precision)
+    first_seen = ~pd.Series(keys).duplicated().values
+    out = df.loc[first_seen].reset_index(drop=True)
+    record_dedup('read_data.limit_df_coordinates', len(df), len(out))
+    return out
+
+
+def iter_frame_chunks(source, chunk_rows=1 << 20, **read_kwargs):
+    '''
+    Yields a dataframe source in chunks of at most chunk_rows rows
+    :param source: dataframe, iterable of dataframes, or path of a CSV or Parquet file
+    :param read_kwargs: keyword arguments for pandas.read_csv (e.g. index_col=0)
+    '''
+    import pandas as pd
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, max(len(source), 1), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+    elif isinstance(source, (str, os.PathLike)) and str(source).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif isinstance(source, (str, os.PathLike)):
+        with pd.read_csv(source, chunksize=chunk_rows, **read_kwargs) as reader:
+            for chunk in reader:
+                yield chunk
+    else:
+        for chunk in source:
+            yield chunk
+
+
+@timed('read_data.limit_df_coordinates_chunked')
+def limit_df_coordinates_chunked(source, precision=5, chunk_rows=1 << 20, **read_kwargs):
+    '''
+    Same result as limit_df_coordinates, consuming the input chunk by chunk. Only the sorted uint64
+    keys of the cells seen so far and the rows kept are held, so memory is bounded by the number of
+    unique cells rather than the input size.
+    :param source: dataframe, iterable of dataframes, or path of a CSV or Parquet file (see iter_frame_chunks)
+    :param precision: geohash precision
+    :param chunk_rows: rows read per chunk
+    :return: dataframe with the first row of every geohash cell, in input order
+    '''
+    import pandas as pd
+    seen = np.empty(0, dtype=np.uint64)
+    kept = []
+    rows_in = 0
+    for chunk in iter_frame_chunks(source, chunk_rows, **read_kwargs):
+        rows_in += len(chunk)
+        keys = encode_int_many(chunk['lat'].values, chunk['lon'].values, precision)
+        cells, first = np.unique(keys, return_index=True)
+        pos = np.minimum(np.searchsorted(seen, cells), max(len(seen) - 1, 0))
+        new = seen[pos] != cells if len(seen) else np.ones(len(cells), dtype=bool)
+        kept.append(chunk.iloc[np.sort(first[new])])
+        # both sorted and disjoint, so a stable merge keeps seen sorted
+        seen = np.sort(np.concatenate([seen, cells[new]]), kind='mergesort')
+    if not kept:
+        raise ValueError('No rows in source')
+    out = pd.concat(kept, ignore_index=True)
+    record_dedup('read_data.limit_df_coordinates_chunked', rows_in, len(out))
+    return out
+
+def _cell_means(keys, values):
+    '''
+    Mean of values per unique integer geohash key
+    '''
+    cells, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = np.bincount(inverse, weights=values, minlength=len(cells))
+    counts = np.bincount(inverse, minlength=len(cells))
+    return cells, sums / counts
+
+
+def wind_scaling_factors(df_west, df_east, precision=5, keys=None):
+    '''
+    Ratios of mean west to mean east capacity for every geohash cell holding sites from both regions
+    :param keys: optional (west keys, east keys) integer geohashes at precision or finer, to reuse
+    :return: numpy array of per-cell factors, ordered by cell
+    '''
+    if keys is None:
+        west_keys = encode_int_many(df_west['lat'].values, df_west['lon'].values, precision)
+        east_keys = encode_int_many(df_east['lat'].values, df_east['lon'].values, precision)
+    else:
+        west_keys, east_keys = [truncate_int(k, precision) for k in keys]
+    west_cells, west_means = _cell_means(west_keys, df_west['capacity'].values.astype(np.float64))
+    east_cells, east_means = _cell_means(east_keys, df_east['capacity'].values.astype(np.float64))
+    shared, wi, ei = np.intersect1d(west_cells, east_cells, assume_unique=True, return_indices=True)
+    return west_means[wi] / east_means[ei]
 
-    hashes = [tup + (encode(getattr(tup,'lat'), getattr(tup,'lon'), precision),) for tup in df.itertuples()]
-    temp_dict = dict()
-    for tup in hashes: temp_dict[tup[-1]] = temp_dict.get(tup[-1], tup[1:-1])
-    used_coords = list(temp_dict.values())
-    del temp_dict
-    return pd.DataFrame.from_records(used_coords,  columns=df.columns)
 
 def determine_wind_scaling_factor(df_west, df_east, precision=5):
-    westcoords = zip(df_west['lat'], df_west['lon'], df_west['capacity'])
-    eastcoords = zip(df_east['lat'], df_east['lon'], df_east['capacity'])
+    factors = wind_scaling_factors(df_west, df_east, precision)
+    if len(factors) == 0:
+        raise ValueError('No geohash cells at precision {} hold both west and east sites'.format(precision))
+    return float(np.median(factors))
+
+
+# resamples drawn from one seed; the blocks, not the workers, own the random streams
+BOOTSTRAP_BLOCK = 256
+
+
+def _bootstrap_medians(factors, blocks):
+    '''
+    Medians of resamples (with replacement) of factors; runs in a worker process
+    :param blocks: list of (number of resamples, seed) drawn block by block
+    '''
+    medians = []
+    for size, seed in blocks:
+        rng = np.random.default_rng(seed)
+        medians.append(np.median(factors[rng.integers(0, len(factors), (size, len(factors)))], axis=1))
+    return np.concatenate(medians)
+
+
+@timed('read_data.bootstrap_wind_scaling_factor')
+def bootstrap_wind_scaling_factor(df_west, df_east, precision=5, n_boot=2000, ci=0.95, seed=0, processes=None,
+                                  factors=None):
+    '''
+    Median scaling factor with a percentile bootstrap confidence interval over geohash cells.
+    Resamples are split across a process pool.
+    :param n_boot: number of bootstrap resamples
+    :param ci: confidence level of the interval
+    :param seed: seed of the resampling; intervals are reproducible for a given seed on any machine
+    :param processes: worker processes (default: one per CPU); 1 runs in this process
+    :param factors: precomputed per-cell factors, as returned by wind_scaling_factors
+    :return: dict of precision, cells, factor, low and high
+    '''
+    if factors is None:
+        factors = wind_scaling_factors(df_west, df_east, precision)
+    if len(factors) == 0:
+        raise ValueError('No geohash cells at precision {} hold both west and east sites'.format(precision))
+    result = {'precision': precision, 'cells': len(factors)}
+    sizes = [min(BOOTSTRAP_BLOCK, n_boot - start) for start in range(0, n_boot, BOOTSTRAP_BLOCK)]
+    blocks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    processes = min(processes or os.cpu_count() or 1, len(blocks))
+    if processes == 1:
+        medians = _bootstrap_medians(factors, blocks)
+    else:
+        chunks = [blocks[c[0]:c[-1] + 1] for c in np.array_split(np.arange(len(blocks)), processes)]
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            medians = np.concatenate(list(pool.map(_bootstrap_medians, [factors] * len(chunks), chunks)))
+    alpha = (1.0 - ci) / 2
+    result['factor'] = float(np.median(factors))
+    result['low'], result['high'] = [float(q) for q in np.quantile(medians, [alpha, 1.0 - alpha])]
+    return result
 
-    westhash = [(lat, lon, cap, encode(lat, lon, precision)) for lat, lon, cap in westcoords]
-    easthash = [(lat, lon, cap, encode(lat, lon, precision)) for lat, lon, cap in eastcoords]
 
-    d = dict()
-    for lat, lon, cap, h in westhash:
-        d[h] = d.get(h, ([], []))
-        d[h][0].append(cap)
-    for lat, lon, cap, h in easthash:
-        d[h] = d.get(h, ([], []))
-        d[h][1].append(cap)
-    factors = [statistics.mean(l1) / statistics.mean(l2) for l1,l2 in d.values() if len(l1) > 0 and len(l2) > 0]
-    # print(statistics.mean(factors), statistics.median(factors))
-    return statistics.median(factors)
+@timed('read_data.sweep_wind_scaling_factor')
+def sweep_wind_scaling_factor(df_west, df_east, precisions=(3, 4, 5, 6), n_boot=2000, ci=0.95, seed=0,
+                              processes=None):
+    '''
+    Bootstrapped scaling factor at several geohash precisions. Sites are hashed once at the finest
+    precision and truncated for the coarser ones.
+    :return: dataframe with one row per precision: cells, factor, low, high (NaN without shared cells)
+    '''
+    import pandas as pd
+    finest = max(precisions)
+    keys = (encode_int_many(df_west['lat'].values, df_west['lon'].values, finest),
+            encode_int_many(df_east['lat'].values, df_east['lon'].values, finest))
+    rows = []
+    for p in precisions:
+        factors = wind_scaling_factors(df_west, df_east, p, keys=keys)
+        if len(factors) == 0:
+            rows.append({'precision': p, 'cells': 0, 'factor': np.nan, 'low': np.nan, 'high': np.nan})
+            continue
+        rows.append(bootstrap_wind_scaling_factor(df_west, df_east, p, n_boot=n_boot, ci=ci, seed=seed,
+                                                  processes=processes, factors=factors))
+    return pd.DataFrame.from_records(rows, columns=['precision', 'cells', 'factor', 'low', 'high'])
 
 
 
 if __name__ == '__main__':
-    wind1 = extract_wind_capacities('../data/nrel-west_wind_site_metadata.json', region='west')
-    wind2 = extract_wind_capacities('../data/nrel-east_wind_site_metadata.json', region='east')
-    pp = extract_power_plant_capacities('../data/december_generator2017.xlsx')
+    sites = ingest_sources({'plants': ('plants', '../data/december_generator2017.xlsx'),
+                            'wind_west': ('wind', '../data/nrel-west_wind_site_metadata.json', {'region': 'west'}),
+                            'wind_east': ('wind', '../data/nrel-east_wind_site_metadata.json', {'region': 'east'})},
+                           cache_dir=DEFAULT_CACHE_DIR)
     # solar = pd.read_csv('solar_capacities.csv', index_col=0)
-    solar = query_solar_capacities('0N0jKddAOiNVOkIqIWIKMVrpqtmfd9XjhACEoU52', df=pp.append(wind1).append(wind2), dtype='avg_ghi', request=False, delay=3.6, verbose=True, hash_precision=4)
+    if os.path.exists('solar_capacities_ghi.csv'):
+        # only cells added since the last run are queried
+        solar = refresh_solar_capacities('0N0jKddAOiNVOkIqIWIKMVrpqtmfd9XjhACEoU52', 'solar_capacities_ghi.csv', df=sites, dtype='avg_ghi', request=False, delay=3.6, verbose=True, hash_precision=4)
+    else:
+        solar = query_solar_capacities('0N0jKddAOiNVOkIqIWIKMVrpqtmfd9XjhACEoU52', df=sites, dtype='avg_ghi', request=False, delay=3.6, verbose=True, hash_precision=4)
     solar.to_csv('solar_capacities_ghi.csv')
+    write_metrics()
 
     # windW = extract_wind_capacities('../data/nrel-west_wind_site_metadata.json', region='west')
     # windE = extract_wind_capacities('../data/nrel-east_wind_site_metadata.json', region='east')
     # factor = determine_wind_scaling_factor(windW, windE)
     # windE['capacity'] *= factor
-    # wind = windW.append(windE)
+    # wind = pd.concat([windW, windE], ignore_index=True)
     # print(wind)
 
 
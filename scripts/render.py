@@ -0,0 +1,79 @@
+import configparser
+import os
+import re
+from instrumentation import timed
+
+# backend used by render() when none is given; PLOT_BACKEND and PLOT_OUTPUT_DIR override the defaults
+DEFAULT_BACKEND = os.environ.get('PLOT_BACKEND', 'html')
+DEFAULT_OUTPUT_DIR = os.environ.get('PLOT_OUTPUT_DIR', 'figures')
+
+
+def figure_name(title_string, filename=None):
+    '''
+    Name a figure is rendered under: filename if given, else the title with whitespace and slashes dashed
+    '''
+    return re.sub(r'[\s/]+', '-', title_string) if filename is None else filename
+
+
+def render_cloud(fig, name, output_dir=None):
+    '''
+    Uploads the figure to the Plotly cloud, setting credentials from config.ini on first use
+    :return: URL of the uploaded figure
+    '''
+    import plotly.plotly as py
+    import plotly.tools
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    plotly.tools.set_credentials_file(username=config['DEFAULT']['NREL_USERNAME'],
+                                      api_key=config['DEFAULT']['NREL_API_KEY'])
+    return py.plot(fig, filename=name)
+
+
+def render_html(fig, name, output_dir=DEFAULT_OUTPUT_DIR):
+    '''
+    Writes the figure as a self-contained HTML file with plotly.js inlined; no network access needed
+    :return: path of the written file
+    '''
+    import plotly.offline
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name + '.html')
+    plotly.offline.plot(fig, filename=path, auto_open=False, include_plotlyjs=True)
+    return path
+
+
+def render_png(fig, name, output_dir=DEFAULT_OUTPUT_DIR):
+    '''
+    Writes the figure as a static PNG through plotly's image export (kaleido)
+    :return: path of the written file
+    '''
+    import plotly.io
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name + '.png')
+    plotly.io.write_image(fig, path)
+    return path
+
+
+RENDER_BACKENDS = {
+    'cloud': render_cloud,
+    'html': render_html,
+    'png': render_png,
+}
+
+
+def register_backend(name, func):
+    '''
+    Adds a render backend: a function (fig, name, output_dir) returning where the figure went
+    '''
+    RENDER_BACKENDS[name] = func
+
+
+def render(fig, name, backend=None, output_dir=None):
+    '''
+    Renders a figure with the named backend (default DEFAULT_BACKEND)
+    :return: whatever the backend returns (a path or URL)
+    '''
+    backend = DEFAULT_BACKEND if backend is None else backend
+    if backend not in RENDER_BACKENDS:
+        raise ValueError('Unknown render backend {}; known: {}'.format(backend, ', '.join(sorted(RENDER_BACKENDS))))
+    with timed('render.' + backend):
+        return RENDER_BACKENDS[backend](fig, name, DEFAULT_OUTPUT_DIR if output_dir is None else output_dir)
@@ -0,0 +1,129 @@
+import json
+import sqlite3
+
+
+class ResponseCache:
+    '''
+    On-disk SQLite cache of NREL API responses keyed by (endpoint, geohash, precision).
+    Only successful responses are stored, so a re-run fetches exactly the cells that are
+    missing or failed last time. Every get is counted as a hit or a miss.
+    :param path: SQLite database file, created if it does not exist
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                          'endpoint TEXT NOT NULL, geohash TEXT NOT NULL, precision INTEGER NOT NULL, '
+                          'response TEXT NOT NULL, fetched REAL NOT NULL DEFAULT (julianday(\'now\')), '
+                          'PRIMARY KEY (endpoint, geohash, precision))')
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, endpoint, geohash):
+        '''
+        :return: decoded response for the cell, or None if it is not cached
+        '''
+        row = self.conn.execute('SELECT response FROM responses WHERE endpoint = ? AND geohash = ? AND precision = ?',
+                                (endpoint, geohash, len(geohash))).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def __contains__(self, key):
+        '''
+        Whether an (endpoint, geohash) cell is cached, without counting a hit or miss
+        '''
+        endpoint, geohash = key
+        return self.conn.execute('SELECT 1 FROM responses WHERE endpoint = ? AND geohash = ? AND precision = ?',
+                                 (endpoint, geohash, len(geohash))).fetchone() is not None
+
+    def get_many(self, endpoint, geohashes):
+        '''
+        :return: dict of geohash -> decoded response for the cached cells among geohashes
+        '''
+        found = dict()
+        for h in geohashes:
+            j = self.get(endpoint, h)
+            if j is not None:
+                found[h] = j
+        return found
+
+    def items(self, endpoint, precision=None):
+        '''
+        Iterates over (geohash, decoded response) for every cached cell of an endpoint, without
+        counting hits or misses
+        :param precision: only yield cells of this geohash precision, if given
+        '''
+        if precision is None:
+            rows = self.conn.execute('SELECT geohash, response FROM responses WHERE endpoint = ?', (endpoint,))
+        else:
+            rows = self.conn.execute('SELECT geohash, response FROM responses WHERE endpoint = ? AND precision = ?',
+                                     (endpoint, precision))
+        for h, response in rows:
+            yield h, json.loads(response)
+
+    def put(self, endpoint, geohash, response):
+        '''
+        Stores a decoded response and commits, so it survives a crash later in the run
+        '''
+        self.conn.execute('INSERT OR REPLACE INTO responses (endpoint, geohash, precision, response) VALUES (?, ?, ?, ?)',
+                          (endpoint, geohash, len(geohash), json.dumps(response)))
+        self.conn.commit()
+
+    def import_jsonl(self, filename, endpoint, hashdict):
+        '''
+        Loads the JSON lines written by save_all_solar_capacities. NREL echoes the query point
+        under 'inputs', which is matched against the query points of hashdict.
+        :param hashdict: dict of geohash -> (lat, lon) query point, as made by limit_coordinates
+        :return: number of cells imported
+        '''
+        by_point = dict()
+        for h, (qlat, qlon) in hashdict.items():
+            by_point.setdefault((str(qlat), str(qlon)), []).append(h)
+        count = 0
+        with open(filename, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                j = json.loads(line)
+                if 'outputs' not in j or 'inputs' not in j:
+                    continue
+                for h in by_point.get((str(j['inputs']['lat']), str(j['inputs']['lon'])), []):
+                    self.conn.execute('INSERT OR REPLACE INTO responses (endpoint, geohash, precision, response) '
+                                      'VALUES (?, ?, ?, ?)', (endpoint, h, len(h), json.dumps(j)))
+                    count += 1
+        self.conn.commit()
+        return count
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+    def report(self):
+        print('Response cache {}: {} hits, {} misses, {} entries'.format(self.path, self.hits, self.misses, len(self)))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def open_cache(cache):
+    '''
+    :param cache: ResponseCache, path to a cache file, or None
+    :return: ResponseCache or None; a cache opened from a path is the caller's to close
+    '''
+    if cache is None or isinstance(cache, ResponseCache):
+        return cache
+    return ResponseCache(cache)
@@ -0,0 +1,93 @@
+import numpy as np
+from geohash import encode_many
+from nrel import SOLAR_RESOURCE_URL
+
+VARIABLES = ('avg_dni', 'avg_ghi', 'avg_lat_tilt')
+PERIODS = ('annual', 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+
+
+def _response_row(j):
+    '''
+    Flattens the outputs of one solar resource response into a row ordered like the table columns.
+    NREL reports 'no data' for some cells in place of the variable; those become NaN.
+    '''
+    outputs = j.get('outputs', {}) if isinstance(j, dict) else {}
+    row = []
+    for var in VARIABLES:
+        values = outputs.get(var) if isinstance(outputs, dict) else None
+        if not isinstance(values, dict):
+            values = {}
+        monthly = values.get('monthly') if isinstance(values.get('monthly'), dict) else {}
+        for period in PERIODS:
+            v = values.get('annual') if period == 'annual' else monthly.get(period)
+            row.append(v if isinstance(v, (int, float)) else np.nan)
+    return row
+
+
+def solar_resource_table(responses):
+    '''
+    Builds a columnar table holding every variable at annual and monthly resolution
+    :param responses: dict (or iterable of pairs) of geohash -> decoded solar resource response
+    :return: dataframe indexed by geohash with (variable, period) columns
+    '''
+    import pandas as pd
+    if isinstance(responses, dict):
+        responses = responses.items()
+    index, rows = [], []
+    for h, j in responses:
+        index.append(h)
+        rows.append(_response_row(j))
+    columns = pd.MultiIndex.from_product([VARIABLES, PERIODS], names=['dtype', 'time'])
+    values = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    return pd.DataFrame(values, index=pd.Index(index, name='geohash'), columns=columns)
+
+
+def table_from_cache(cache, endpoint=SOLAR_RESOURCE_URL, precision=None):
+    '''
+    Builds the solar resource table from every response in a ResponseCache
+    :param precision: only use cells of this geohash precision, if given
+    '''
+    return solar_resource_table(cache.items(endpoint, precision))
+
+
+def save_solar_table(table, filename):
+    '''
+    Saves a solar resource table as a NumPy .npz archive
+    '''
+    np.savez(filename, geohash=np.asarray(table.index, dtype=str), values=table.values,
+             dtype=np.asarray(table.columns.get_level_values(0), dtype=str),
+             time=np.asarray(table.columns.get_level_values(1), dtype=str))
+
+
+def load_solar_table(filename):
+    '''
+    Loads a solar resource table written by save_solar_table
+    '''
+    import pandas as pd
+    with np.load(filename) as f:
+        columns = pd.MultiIndex.from_arrays([f['dtype'], f['time']], names=['dtype', 'time'])
+        return pd.DataFrame(f['values'], index=pd.Index(f['geohash'], name='geohash'), columns=columns)
+
+
+def lookup_solar_values(table, geohashes, dtype='avg_dni', time='annual', fill=0.0):
+    '''
+    Vectorized lookup of one variable for many geohash cells
+    :param geohashes: array of geohashes at the precision the table was built with
+    :param fill: value for cells missing from the table or without data
+    :return: numpy array of values aligned with geohashes
+    '''
+    column = table[(dtype, time)]
+    values = column.reindex(np.asarray(geohashes, dtype=str)).values
+    return np.where(np.isnan(values), fill, values)
+
+
+def solar_capacities_from_table(table, lat, lon, dtype='avg_dni', time='annual', hash_precision=5, fill=0.0):
+    '''
+    Computes the same dataframe as query_solar_capacities from a stored table, without network calls
+    :return: dataframe of lat, lon and capacity
+    '''
+    import pandas as pd
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    capacity = lookup_solar_values(table, encode_many(lat, lon, hash_precision), dtype, time, fill)
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'capacity': capacity})
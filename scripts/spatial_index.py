@@ -0,0 +1,211 @@
+import numpy as np
+from geohash import encode_int_many, cell_indices_int, int_from_cell_indices
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * np.pi / 180.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''
+    Great-circle distance in km, broadcasting over array arguments
+    '''
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2)]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class GeohashIndex:
+    '''
+    Nearest-neighbour index over points, bucketed by integer geohash cell. Points are sorted by
+    cell key, so the points of any cell are one contiguous slice found by binary search. A query
+    scans growing square blocks of cells around its own cell until no unscanned cell can hold a
+    closer point, so results are exact haversine neighbours.
+    :param lat: array of point latitudes
+    :param lon: array of point longitudes
+    :param precision: geohash precision of the buckets
+    :param max_ring: widest block (in cells from the centre) scanned before falling back to brute force
+    '''
+
+    def __init__(self, lat, lon, precision=4, max_ring=8):
+        self.precision = precision
+        self.max_ring = max_ring
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        keys = encode_int_many(lat, lon, precision)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+        self.lat = lat[self.order]
+        self.lon = lon[self.order]
+        # longitude takes the odd bit when 5 * precision is odd
+        self.lon_cells = 1 << ((5 * precision + 1) // 2)
+        self.lat_cells = 1 << (5 * precision // 2)
+        self.cell_height_km = 180.0 / self.lat_cells * KM_PER_DEGREE
+        self.cell_width_deg = 360.0 / self.lon_cells
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _block(self, lon_q, lat_q, ring):
+        '''
+        Candidate (query, point) pairs for the square block of cells within ring of each query cell
+        '''
+        offsets = np.arange(-ring, ring + 1)
+        dlon, dlat = [a.ravel() for a in np.meshgrid(offsets, offsets)]
+        lat_n = lat_q[:, np.newaxis] + dlat
+        lon_n = lon_q[:, np.newaxis] + dlon
+        inside = (lat_n >= 0) & (lat_n < self.lat_cells)
+        if 2 * ring + 1 > self.lon_cells:
+            # the block wraps onto itself; keep each longitude column once
+            inside &= (dlon >= -(self.lon_cells // 2)) & (dlon < self.lon_cells - self.lon_cells // 2)
+        cells = int_from_cell_indices(lon_n, np.clip(lat_n, 0, self.lat_cells - 1), self.precision)
+        start = np.searchsorted(self.keys, cells, side='left')
+        stop = np.searchsorted(self.keys, cells, side='right')
+        counts = np.where(inside, stop - start, 0)
+        total = counts.sum(axis=1)
+        query = np.repeat(np.arange(len(lat_q)), total)
+        flat_counts = counts.ravel()
+        nonempty = flat_counts > 0
+        starts = np.repeat(start.ravel()[nonempty], flat_counts[nonempty])
+        # position within each cell's run of points
+        run_offsets = np.arange(len(starts)) - np.repeat(np.cumsum(flat_counts[nonempty]) - flat_counts[nonempty],
+                                                         flat_counts[nonempty])
+        return query, starts + run_offsets
+
+    def _clearance_km(self, lat, ring):
+        '''
+        Lower bound on the distance from a query to any cell outside its block of the given ring
+        '''
+        lat_clear = ring * self.cell_height_km
+        edge = np.minimum(np.abs(lat) + (ring + 1) * 180.0 / self.lat_cells, 90.0)
+        dlon = np.radians(np.minimum(ring * self.cell_width_deg, 90.0))
+        lon_clear = EARTH_RADIUS_KM * np.arcsin(np.cos(np.radians(edge)) * np.sin(dlon))
+        return np.minimum(lat_clear, lon_clear)
+
+    def query(self, lat, lon, k=1, max_km=None):
+        '''
+        k nearest points to each query location
+        :param max_km: ignore points further than this, which also stops the search early
+        :return: (distances in km, indices into the original point arrays), both of shape (n, k);
+                 rows with fewer than k points available are padded with inf and -1
+        '''
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        n = len(lat)
+        dist = np.full((n, k), np.inf)
+        idx = np.full((n, k), -1, dtype=np.int64)
+        if len(self) == 0 or n == 0:
+            return dist, idx
+        lon_q, lat_q = cell_indices_int(encode_int_many(lat, lon, self.precision), self.precision)
+        pending = np.arange(n)
+        for ring in range(1, self.max_ring + 1):
+            if len(pending) == 0:
+                break
+            query, points = self._block(lon_q[pending], lat_q[pending], ring)
+            d = haversine(lat[pending][query], lon[pending][query], self.lat[points], self.lon[points])
+            best_d, best_i = self._top_k(query, points, d, len(pending), k)
+            clearance = self._clearance_km(lat[pending], ring)
+            done = best_d[:, k - 1] <= clearance
+            if max_km is not None:
+                done |= clearance >= max_km
+            dist[pending[done]] = best_d[done]
+            idx[pending[done]] = best_i[done]
+            pending = pending[~done]
+        if len(pending):
+            self._brute_force(lat, lon, pending, k, dist, idx)
+        if max_km is not None:
+            beyond = dist > max_km
+            dist[beyond] = np.inf
+            idx[beyond] = -1
+        return dist, np.where(idx >= 0, self.order[np.maximum(idx, 0)], -1)
+
+    @staticmethod
+    def _top_k(query, points, d, n, k):
+        '''
+        Per-query k smallest distances from flat (query, point, distance) candidate arrays
+        '''
+        best_d = np.full((n, k), np.inf)
+        best_i = np.full((n, k), -1, dtype=np.int64)
+        order = np.lexsort((d, query))
+        query, points, d = query[order], points[order], d[order]
+        first = np.searchsorted(query, np.arange(n))
+        rank = np.arange(len(query)) - first[query]
+        keep = rank < k
+        best_d[query[keep], rank[keep]] = d[keep]
+        best_i[query[keep], rank[keep]] = points[keep]
+        return best_d, best_i
+
+    def _brute_force(self, lat, lon, pending, k, dist, idx):
+        kk = min(k, len(self))
+        for i in pending:
+            d = haversine(lat[i], lon[i], self.lat, self.lon)
+            nearest = np.argpartition(d, kk - 1)[:kk]
+            nearest = nearest[np.argsort(d[nearest], kind='stable')]
+            dist[i, :kk] = d[nearest]
+            idx[i, :kk] = nearest
+
+    def query_radius(self, lat, lon, radius_km):
+        '''
+        All points within radius_km of each query location
+        :return: (query indices, point indices into the original arrays, distances in km) as flat arrays
+                 sorted by query then distance
+        '''
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        lon_q, lat_q = cell_indices_int(encode_int_many(lat, lon, self.precision), self.precision)
+        needed = np.full(len(lat), self.max_ring + 1)
+        for ring in range(self.max_ring, 0, -1):
+            needed[self._clearance_km(lat, ring) >= radius_km] = ring
+        queries, points, dists = [], [], []
+        for ring in np.unique(needed):
+            sel = np.flatnonzero(needed == ring)
+            if ring > self.max_ring:
+                # too wide a block; compare against every point instead
+                query = np.repeat(sel, len(self))
+                point = np.tile(np.arange(len(self)), len(sel))
+            else:
+                query, point = self._block(lon_q[sel], lat_q[sel], int(ring))
+                query = sel[query]
+            d = haversine(lat[query], lon[query], self.lat[point], self.lon[point])
+            within = d <= radius_km
+            queries.append(query[within])
+            points.append(point[within])
+            dists.append(d[within])
+        query, point, d = [np.concatenate(a) if a else np.empty(0) for a in (queries, points, dists)]
+        order = np.lexsort((d, query))
+        return query[order].astype(np.int64), self.order[point[order].astype(np.int64)], d[order]
+
+
+def attach_nearest(df, sites, column='capacity', name=None, max_km=None, precision=4, index=None):
+    '''
+    Copies df with the value of the nearest site attached to every row
+    :param df: dataframe with lat and lon columns
+    :param sites: dataframe with lat, lon and column
+    :param column: column of sites to attach
+    :param name: name of the attached column (default: column); the distance goes in name + '_km'
+    :param max_km: leave the value missing where the nearest site is further than this
+    :param index: prebuilt GeohashIndex over sites, to reuse across joins
+    :return: dataframe
+    '''
+    name = column if name is None else name
+    if index is None:
+        index = GeohashIndex(sites['lat'].values, sites['lon'].values, precision=precision)
+    dist, idx = index.query(df['lat'].values, df['lon'].values, k=1, max_km=max_km)
+    dist, idx = dist[:, 0], idx[:, 0]
+    values = sites[column].values[np.maximum(idx, 0)].astype(np.float64)
+    missing = idx < 0
+    out = df.copy()
+    out[name] = np.where(missing, np.nan, values)
+    out[name + '_km'] = dist
+    return out
+
+
+def join_nearest_resources(plants, wind, solar, max_km=None, precision=4):
+    '''
+    Attaches the nearest wind capacity factor and solar GHI to every power plant
+    :param plants: dataframe of plant capacities
+    :param wind: dataframe of wind capacities
+    :param solar: dataframe of solar capacities
+    :return: plants with wind_capacity, wind_capacity_km, solar_capacity and solar_capacity_km columns
+    '''
+    out = attach_nearest(plants, wind, name='wind_capacity', max_km=max_km, precision=precision)
+    return attach_nearest(out, solar, name='solar_capacity', max_km=max_km, precision=precision)
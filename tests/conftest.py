@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the scripts import each other as top level modules
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+DATA = os.path.join(os.path.dirname(SCRIPTS), 'data')
+sys.path.insert(0, SCRIPTS)
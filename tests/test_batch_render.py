@@ -0,0 +1,30 @@
+import os
+import numpy as np
+import pandas as pd
+from batch_render import render_batch
+
+
+def test_multicolor_split_by_any_column(tmp_path):
+    rng = np.random.default_rng(0)
+    plants = pd.DataFrame({'lat': rng.uniform(30, 45, 60), 'lon': rng.uniform(-110, -80, 60),
+                           'capacity': rng.uniform(1, 500, 60), 'technology': ['Wind', 'Solar', 'Coal'] * 20,
+                           'status': ['OP', 'SB'] * 30})
+    specs = [{'func': 'capacity_bubbleplot_multicolor', 'data': 'pp', 'args': ('Plants by Status', 10),
+              'kwargs': {'split': 'status'}},
+             {'func': 'capacity_bubbleplot_multicolor', 'data': 'pp', 'args': ('Plants by Type', 10)}]
+    paths = render_batch(specs, {'pp': plants}, processes=1, backend='html', output_dir=str(tmp_path))
+    assert [os.path.basename(p) for p in paths] == ['Plants-by-Status.html', 'Plants-by-Type.html']
+    assert all(os.path.isfile(p) for p in paths)
+
+
+def test_level_of_detail_is_shared_between_specs():
+    import batch_render
+    rng = np.random.default_rng(0)
+    solar = pd.DataFrame({'lat': rng.uniform(30, 45, 500), 'lon': rng.uniform(-110, -80, 500),
+                          'capacity': rng.uniform(3, 6, 500)})
+    batch_render._init_worker({}, None)
+    batch_render._frames['solar'] = solar
+    lod = {'frame': 'solar', 'lod': {'max_points': 100}}
+    first = batch_render._resolve_data(lod)
+    assert batch_render._resolve_data({'lod': {'max_points': 100}, 'frame': 'solar'}) is first
+    assert batch_render._resolve_data({'frame': 'solar', 'lod': {'max_points': 50}}) is not first
@@ -0,0 +1,24 @@
+import numpy as np
+from dataset_cache import cached_frame
+
+
+def _load(source):
+    import pandas as pd
+    return pd.DataFrame({'lat': np.arange(4.0), 'lon': np.arange(4.0), 'name': list('abcd')})
+
+
+def test_warm_frame_is_writable_like_cold_frame(tmp_path):
+    source = tmp_path / 'source.txt'
+    source.write_text('x')
+    cache_dir = str(tmp_path / 'cache')
+    cold = cached_frame(_load, str(source), cache_dir)
+    warm = cached_frame(_load, str(source), cache_dir)
+    for df in (cold, warm):
+        df.loc[0, 'lat'] = 10.0
+        df['lon'] *= 2
+        assert df.loc[0, 'lat'] == 10.0
+        assert df['lon'].tolist() == [0.0, 2.0, 4.0, 6.0]
+    # edits of a warm frame never reach the cache entry
+    again = cached_frame(_load, str(source), cache_dir)
+    assert again['lat'].tolist() == [0.0, 1.0, 2.0, 3.0]
+    assert again['name'].tolist() == list('abcd')
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from geohash import (encode, decode, decode_exactly, encode_many, decode_many, decode_exactly_many, encode_int_many,
+                     truncate_int, int_to_geohash, int_precision, geohash_to_int)
+
+PRECISIONS = range(0, 13)
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(0)
+    special = [(np.nan, 0.0), (0.0, np.nan), (np.inf, 0.0), (-np.inf, 0.0), (0.0, np.inf), (0.0, -np.inf),
+               (90.0, 0.0), (-90.0, 0.0), (0.0, 180.0), (0.0, -180.0), (90.0, 180.0), (-90.0, -180.0),
+               (0.0, 0.0), (45.0, 90.0), (-22.5, -45.0), (89.999999, 179.999999), (-89.999999, -179.999999)]
+    lat = np.r_[[p[0] for p in special], rng.uniform(-90, 90, 300)]
+    lon = np.r_[[p[1] for p in special], rng.uniform(-180, 180, 300)]
+    return lat, lon
+
+
+@pytest.mark.parametrize('precision', PRECISIONS)
+def test_encode_many_matches_encode(points, precision):
+    lat, lon = points
+    expected = [encode(a, b, precision) for a, b in zip(lat, lon)]
+    assert encode_many(lat, lon, precision).tolist() == expected
+    keys = encode_int_many(lat, lon, precision)
+    assert int_to_geohash(keys).tolist() == expected
+    assert (int_precision(keys) == precision).all()
+    assert (geohash_to_int(expected) == keys).all()
+
+
+@pytest.mark.parametrize('precision', PRECISIONS)
+def test_truncate_int_matches_coarser_encoding(points, precision):
+    lat, lon = points
+    full = encode_int_many(lat, lon, 12)
+    assert (truncate_int(full, precision) == encode_int_many(lat, lon, precision)).all()
+    # keys already at or below the precision are unchanged
+    coarse = encode_int_many(lat, lon, precision)
+    assert (truncate_int(coarse, 12) == coarse).all()
+
+
+@pytest.mark.parametrize('precision', range(1, 13))
+def test_decode_many_matches_decode(points, precision):
+    lat, lon = points
+    hashes = [encode(a, b, precision) for a, b in zip(lat, lon)]
+    exact = decode_exactly_many(hashes)
+    expected = [decode_exactly(h) for h in hashes]
+    for i in range(4):
+        assert exact[i].tolist() == [e[i] for e in expected]
+    lats, lons = decode_many(hashes)
+    assert list(zip(lats.tolist(), lons.tolist())) == [decode(h) for h in hashes]
+
+
+def test_int_order_is_string_order(points):
+    lat, lon = points
+    keys = encode_int_many(lat, lon, 7)
+    hashes = int_to_geohash(keys)
+    assert hashes[np.argsort(keys, kind='stable')].tolist() == sorted(hashes.tolist())
@@ -0,0 +1,23 @@
+import io
+import json
+import os
+import pytest
+from conftest import DATA
+from geojson_stream import iter_features
+
+WIND = os.path.join(DATA, 'nrel-east_wind_site_metadata.json')
+
+
+def test_every_chunk_size_yields_all_features():
+    with open(WIND, 'r') as f:
+        text = f.read()
+    expected = json.loads(text)['features']
+    for chunk_bytes in range(1, 129):
+        features = list(iter_features(io.StringIO(text), chunk_bytes))
+        assert len(features) == len(expected), chunk_bytes
+        assert features[0] == expected[0] and features[-1] == expected[-1], chunk_bytes
+
+
+def test_missing_features_array_raises():
+    with pytest.raises(ValueError):
+        list(iter_features(io.StringIO('{"type": "FeatureCollection"}'), 4))
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+import pytest
+from conftest import SCRIPTS
+
+
+@pytest.mark.parametrize('module', ['read_data', 'plot_data', 'level_of_detail', 'gridding', 'spatial_index'])
+def test_import_does_not_load_pandas(module):
+    # a fresh interpreter, as the modules of this one are already loaded
+    code = 'import sys; import {}; print("pandas" in sys.modules)'.format(module)
+    out = subprocess.run([sys.executable, '-c', code], cwd=SCRIPTS, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
@@ -0,0 +1,20 @@
+import os
+import pytest
+from conftest import DATA
+from read_data import ingest_sources
+
+WIND = os.path.join(DATA, 'nrel-east_wind_site_metadata.json')
+SOLAR = os.path.join(DATA, 'solar_capacities_ghi_nozeros.csv')
+
+
+def test_merges_sources_with_source_column():
+    merged = ingest_sources({'wind': ('wind', WIND, {'region': 'east'}), 'solar': ('solar', SOLAR)}, processes=1)
+    assert list(merged['source'].cat.categories) == ['wind', 'solar']
+    assert merged['source'].iloc[0] == 'wind' and merged['source'].iloc[-1] == 'solar'
+    assert merged[['lat', 'lon', 'capacity']].notna().all().all()
+
+
+@pytest.mark.parametrize('sources', [{}, {'x': ('nope', WIND)}])
+def test_invalid_sources_raise(sources):
+    with pytest.raises(ValueError):
+        ingest_sources(sources, processes=1)
@@ -0,0 +1,27 @@
+import json
+import math
+from instrumentation import Metrics, record_dedup
+
+
+def test_prometheus_spells_non_finite_values():
+    metrics = Metrics()
+    record_dedup('stage', 0, 0, metrics)
+    metrics.gauge('up', math.inf)
+    metrics.gauge('down', -math.inf)
+    metrics.gauge('ratio', 0.5)
+    lines = metrics.to_prometheus().splitlines()
+    assert 'solarwind_stage_dedup_ratio NaN' in lines
+    assert 'solarwind_up +Inf' in lines
+    assert 'solarwind_down -Inf' in lines
+    assert 'solarwind_ratio 0.5' in lines
+    assert 'solarwind_stage_rows_in_total 0' in lines
+    assert not any(line.endswith((' nan', ' inf', ' -inf')) for line in lines)
+
+
+def test_json_round_trips():
+    metrics = Metrics()
+    metrics.count('requests', 3)
+    metrics.observe('latency', 0.2)
+    d = json.loads(metrics.to_json())
+    assert d['counters'] == {'requests': 3}
+    assert d['histograms']['latency']['buckets']['0.25'] == 1
@@ -0,0 +1,109 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import pytest
+from benchmarks import StubSolarResourceHandler, start_stub_server
+from instrumentation import METRICS
+from nrel import NRELError, fetch_solar_resource, fetch_solar_resources, make_session
+from read_data import query_solar_capacities
+
+
+class FlakyHandler(StubSolarResourceHandler):
+    '''
+    Answers the first `failures` requests with `status`, then like the stub
+    '''
+    failures = 2
+    status = 429
+    calls = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            type(self).calls += 1
+            fail = type(self).calls <= self.failures
+        if not fail:
+            return super().do_GET()
+        self.send_response(self.status)
+        self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}/api/solar/solar_resource/v1.json'.format(server.server_address[1])
+
+
+def handler(status, failures):
+    return type('Handler{}'.format(status), (FlakyHandler,), {'status': status, 'failures': failures, 'calls': 0})
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retries_then_succeeds(status):
+    server, url = serve(handler(status, 2))
+    try:
+        with make_session(1) as session:
+            j, retries = fetch_solar_resource(session, 'key', 40.0, -100.0, url=url, retries=3, backoff=0.0)
+    finally:
+        server.shutdown()
+    assert retries == 2
+    assert j['outputs']['avg_dni']['annual'] > 0
+
+
+def test_retries_exhausted_raises():
+    server, url = serve(handler(429, 10))
+    METRICS.reset()
+    try:
+        with make_session(1) as session, pytest.raises(NRELError):
+            fetch_solar_resource(session, 'key', 40.0, -100.0, url=url, retries=2, backoff=0.0)
+    finally:
+        server.shutdown()
+    assert METRICS.counter('nrel.requests') == 3
+    assert METRICS.counter('nrel.http_429') == 3
+
+
+def test_client_error_is_not_retried():
+    server, url = serve(handler(403, 10))
+    try:
+        with make_session(1) as session, pytest.raises(NRELError):
+            fetch_solar_resource(session, 'key', 40.0, -100.0, url=url, retries=5, backoff=0.0)
+    finally:
+        server.shutdown()
+    assert server.RequestHandlerClass.calls == 1
+
+
+def test_failed_cells_are_reported_not_raised():
+    server, url = serve(handler(500, 100))
+    try:
+        results, errors = fetch_solar_resources('key', {'9zzzz': (40.0, -100.0)}, url=url, retries=1, backoff=0.0,
+                                                per_second_limit=None)
+    finally:
+        server.shutdown()
+    assert results == {} and list(errors) == ['9zzzz']
+
+
+def test_rate_limit_is_respected():
+    server, url = start_stub_server()
+    hashdict = dict(('c{}'.format(i), (30.0 + i, -100.0)) for i in range(5))
+    start = time.perf_counter()
+    try:
+        results, errors = fetch_solar_resources('key', hashdict, url=url, per_second_limit=4.0)
+    finally:
+        server.shutdown()
+    assert len(results) == 5 and not errors
+    # a burst of 4, then the fifth request waits a quarter second for its token
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_query_solar_capacities_against_stub():
+    server, url = start_stub_server()
+    lat, lon = [35.0, 35.00001, 41.0], [-110.0, -110.00001, -95.0]
+    try:
+        df = query_solar_capacities('key', lat=lat, lon=lon, url=url, per_second_limit=None)
+    finally:
+        server.shutdown()
+    assert df['lat'].tolist() == lat
+    assert df['capacity'].notna().all()
+    # both points of the first geohash cell share the cell's value
+    assert df['capacity'][0] == df['capacity'][1]
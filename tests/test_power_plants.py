@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from benchmarks import aggregate_power_plant_capacities_loop, make_generator_sheet
+from read_data import aggregate_power_plant_capacities
+
+
+def assert_same_plants(x):
+    loop = aggregate_power_plant_capacities_loop(x).sort_values('name', ignore_index=True)
+    groupby = aggregate_power_plant_capacities(x).sort_values('name', ignore_index=True)
+    assert loop['name'].tolist() == groupby['name'].tolist()
+    assert np.array_equal(loop[['lat', 'lon']].values, groupby[['lat', 'lon']].values)
+    # the groupby sums in another order, so capacities agree to float rounding
+    assert np.allclose(loop['capacity'], groupby['capacity'], rtol=1e-12, atol=0.0, equal_nan=True)
+
+
+def test_missing_technology_and_capacity_match_loop():
+    x = pd.DataFrame({'Plant ID': [1, 1, 2, 3, 3],
+                      'Plant Name': ['A', 'A', 'B', 'C', 'C'],
+                      'Latitude': [40.0, 40.0, 35.0, 30.0, 30.0],
+                      'Longitude': [-100.0, -100.0, -90.0, -80.0, -80.0],
+                      'Nameplate Capacity (MW)': [1.5, 2.5, 3.0, np.nan, 4.0],
+                      'Technology': ['Nuclear', 'Nuclear', np.nan, 'Onshore Wind Turbine', 'Onshore Wind Turbine'],
+                      'Status': ['(OP) Operating'] * 5})
+    assert_same_plants(x)
+    plants = aggregate_power_plant_capacities(x)
+    assert plants['name'].tolist() == ['A (Nuclear)', 'B (nan)', 'C (Onshore Wind Turbine)']
+    assert plants['capacity'][0] == 4.0 and np.isnan(plants['capacity'][2])
+
+
+def test_synthetic_sheet_matches_loop():
+    assert_same_plants(make_generator_sheet(600))
@@ -0,0 +1,54 @@
+import warnings
+import numpy as np
+import pytest
+from profile_store import HOURS, MONTH_EDGES, ProfileStore, cell_correlation
+
+
+@pytest.fixture
+def stores(tmp_path):
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(40, 41, 50), rng.uniform(-100, -99, 50)
+    wind = ProfileStore.create(str(tmp_path / 'wind'), lat, lon)
+    wind.fill(lambda la, lo: rng.uniform(0, 1, (len(la), HOURS)).astype(np.float32), chunk_sites=16)
+    solar = ProfileStore.create(str(tmp_path / 'solar'), lat[:30] + 0.001, lon[:30])
+    solar.fill(lambda la, lo: rng.uniform(0, 1, (len(la), HOURS)).astype(np.float32), chunk_sites=16)
+    # partly filled sites: the first wind site lacks January, the second has no values at all
+    wind.profiles[0, :MONTH_EDGES[1]] = np.nan
+    wind.profiles[1] = np.nan
+    solar.profiles[0, ::2] = np.nan
+    return ProfileStore(wind.path), ProfileStore(solar.path)
+
+
+def test_aggregations_ignore_nan_alike(stores):
+    wind, _ = stores
+    full = np.asarray(wind.profiles, dtype=np.float64)
+    monthly = wind.monthly_means(chunk_sites=7)
+    annual = wind.annual_means(chunk_sites=7)
+    median = wind.percentiles([50], chunk_sites=7)[:, 0]
+    assert np.isnan(monthly[0, 0]) and np.allclose(monthly[0, 1], np.nanmean(full[0, MONTH_EDGES[1]:MONTH_EDGES[2]]))
+    assert np.isnan(monthly[1]).all() and np.isnan(annual[1]) and np.isnan(median[1])
+    assert np.allclose(annual[0], np.nanmean(full[0]))
+    assert np.allclose(monthly[2:, 5], full[2:, MONTH_EDGES[5]:MONTH_EDGES[6]].mean(axis=1))
+    assert np.allclose(median[2:], np.median(full[2:], axis=1))
+
+
+def test_cell_correlation_matches_corrcoef(stores):
+    wind, solar = stores
+    # hours missing at every wind site of the cell only count on neither side
+    ProfileStore(wind.path, mode='r+').profiles[:, :24] = np.nan
+    result = cell_correlation(wind, solar, precision=2, chunk_sites=8)
+    assert len(result) == 1 and result['wind_sites'][0] == 50 and result['solar_sites'][0] == 30
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        w = np.nanmean(np.asarray(wind.profiles, dtype=np.float64), axis=0)
+    s = np.nanmean(np.asarray(solar.profiles, dtype=np.float64), axis=0)
+    assert np.isnan(w[:24]).all()
+    assert np.isclose(result['correlation'][0], np.corrcoef(w[24:], s[24:])[0, 1])
+
+
+def test_rows_at(stores, tmp_path):
+    wind, _ = stores
+    assert wind.rows_at(wind.lat[[3, 7]], wind.lon[[3, 7]]).tolist() == [3, 7]
+    assert wind.rows_at(0.0, 0.0).tolist() == [-1]
+    empty = ProfileStore.create(str(tmp_path / 'empty'), [], [])
+    assert empty.rows_at([1.0, 2.0], [1.0, 2.0]).tolist() == [-1, -1]
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from geohash import encode_int_many, int_precision, truncate_int
+from query_planner import plan_cells
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    # continental US with a dense cluster around Denver
+    lat = np.r_[rng.uniform(25, 49, 4000), rng.normal(39.7, 0.2, 1000)]
+    lon = np.r_[rng.uniform(-124, -67, 4000), rng.normal(-105.0, 0.2, 1000)]
+    return lat, lon
+
+
+def check_plan(lat, lon, budget, cells, point_cell):
+    assert 0 < len(cells) <= budget
+    assert len(np.unique(cells)) == len(cells)
+    # every point lies in its cell
+    precisions = int_precision(cells)[point_cell]
+    keys = encode_int_many(lat, lon, 6)
+    for p in np.unique(precisions):
+        sel = precisions == p
+        assert (truncate_int(keys[sel], int(p)) == cells[point_cell[sel]]).all()
+
+
+@pytest.mark.parametrize('budget', [200, 35, 20, 5])
+def test_plan_fits_budget(points, budget):
+    lat, lon = points
+    cells, point_cell = plan_cells(lat, lon, budget)
+    check_plan(lat, lon, budget, cells, point_cell)
+
+
+def test_budget_below_occupied_min_precision_cells_merges(points):
+    lat, lon = points
+    occupied = len(np.unique(encode_int_many(lat, lon, 2)))
+    assert occupied > 20
+    cells, point_cell = plan_cells(lat, lon, 20)
+    check_plan(lat, lon, 20, cells, point_cell)
+    assert int_precision(cells).min() < 2
+
+
+def test_budget_below_occupied_precision_1_cells_raises():
+    lat, lon = np.array([-60.0, 0.0, 60.0]), np.array([-150.0, 0.0, 150.0])
+    with pytest.raises(ValueError):
+        plan_cells(lat, lon, 2)
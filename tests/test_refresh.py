@@ -0,0 +1,13 @@
+import numpy as np
+import pandas as pd
+from read_data import refresh_solar_capacities
+
+PREVIOUS = pd.DataFrame({'lat': [35.0, 41.0], 'lon': [-110.0, -95.0], 'capacity': [5.5, 4.2]})
+
+
+def test_quiet_unless_verbose(capsys):
+    result = refresh_solar_capacities('key', PREVIOUS, lat=[35.0, 30.0], lon=[-110.0, -90.0], request=False)
+    assert capsys.readouterr().out == ''
+    assert result['capacity'][0] == 5.5 and np.isnan(result['capacity'][1])
+    refresh_solar_capacities('key', PREVIOUS, lat=[35.0, 30.0], lon=[-110.0, -90.0], request=False, verbose=True)
+    assert '1 of 2 cells are known' in capsys.readouterr().out
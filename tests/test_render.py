@@ -0,0 +1,46 @@
+import os
+import socket
+import time
+import numpy as np
+import pandas as pd
+import pytest
+import plot_data
+from render import RENDER_BACKENDS, render
+
+# HTML files inline plotly.js (about 3.5 MB); the data of a small figure adds little to that
+SIZE_BOUNDS = {'html': (1 << 20, 16 << 20), 'png': (1 << 10, 4 << 20)}
+MAX_SECONDS = 30.0
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    def connect(self, address):
+        raise AssertionError('render tried to connect to {}'.format(address))
+    monkeypatch.setattr(socket.socket, 'connect', connect)
+
+
+@pytest.fixture
+def figure():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'lat': rng.uniform(30, 45, 200), 'lon': rng.uniform(-110, -80, 200),
+                       'capacity': rng.uniform(0, 1, 200)})
+    return plot_data.capacity_bubbleplot(df, 'Render Test', 10, show=False)
+
+
+@pytest.mark.parametrize('backend', ['html', 'png'])
+def test_offline_backend_writes_bounded_file(backend, figure, tmp_path, no_network):
+    if backend == 'png':
+        pytest.importorskip('kaleido')
+    start = time.perf_counter()
+    path = render(figure, 'render-test', backend=backend, output_dir=str(tmp_path))
+    elapsed = time.perf_counter() - start
+    assert os.path.isfile(path) and path.endswith('.' + backend)
+    low, high = SIZE_BOUNDS[backend]
+    assert low <= os.path.getsize(path) <= high
+    assert elapsed < MAX_SECONDS
+
+
+def test_unknown_backend_raises(figure):
+    assert 'nope' not in RENDER_BACKENDS
+    with pytest.raises(ValueError):
+        render(figure, 'render-test', backend='nope')
@@ -0,0 +1,53 @@
+import sqlite3
+import pytest
+import read_data
+from benchmarks import start_stub_server
+from response_cache import ResponseCache
+
+LAT, LON = [35.0, 41.0], [-110.0, -95.0]
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    caches = []
+
+    def open_cache(cache):
+        caches.append(ResponseCache(cache))
+        return caches[-1]
+    monkeypatch.setattr(read_data, 'open_cache', open_cache)
+    return caches
+
+
+def closed(cache):
+    try:
+        cache.conn.execute('SELECT 1')
+    except sqlite3.ProgrammingError:
+        return True
+    return False
+
+
+def test_cache_opened_from_path_is_closed(tmp_path, opened):
+    server, url = start_stub_server()
+    try:
+        read_data.query_solar_capacities('key', lat=LAT, lon=LON, url=url, per_second_limit=None,
+                                         cache=str(tmp_path / 'cache.db'))
+        read_data.save_all_solar_capacities('key', str(tmp_path / 'out.jsonl'), lat=LAT, lon=LON, url=url,
+                                            per_second_limit=None, cache=str(tmp_path / 'cache.db'))
+    finally:
+        server.shutdown()
+    assert len(opened) == 2 and all(closed(c) for c in opened)
+
+
+def test_dry_run_does_not_count_lookups(tmp_path):
+    server, url = start_stub_server()
+    with ResponseCache(str(tmp_path / 'cache.db')) as cache:
+        try:
+            read_data.query_solar_capacities('key', lat=LAT[:1], lon=LON[:1], url=url, per_second_limit=None,
+                                             cache=cache)
+        finally:
+            server.shutdown()
+        stats = cache.stats()
+        read_data.query_solar_capacities('key', lat=LAT, lon=LON, url=url, request=False, cache=cache)
+        assert cache.stats() == stats
+        assert not closed(cache)
+    assert closed(cache)
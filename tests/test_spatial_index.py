@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from spatial_index import GeohashIndex, haversine
+
+
+def brute_force(lat, lon, plat, plon):
+    return haversine(lat[:, np.newaxis], lon[:, np.newaxis], plat[np.newaxis, :], plon[np.newaxis, :])
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    # scattered over the globe, plus clusters at both poles and across the antimeridian
+    lat = np.r_[rng.uniform(-90, 90, 1500), rng.uniform(88.5, 90, 150), rng.uniform(-90, -88.5, 150),
+                rng.uniform(-20, 20, 200)]
+    lon = np.r_[rng.uniform(-180, 180, 1500), rng.uniform(-180, 180, 300),
+                np.where(rng.random(200) < 0.5, rng.uniform(-180, -179, 200), rng.uniform(179, 180, 200))]
+    return lat, lon
+
+
+@pytest.fixture
+def queries():
+    rng = np.random.default_rng(1)
+    lat = np.r_[rng.uniform(-90, 90, 150), 90.0, -90.0, 89.9, -89.9, 0.0, 10.0, -10.0]
+    lon = np.r_[rng.uniform(-180, 180, 150), 0.0, 45.0, 180.0, -180.0, 179.99, -179.99, 180.0]
+    return lat, lon
+
+
+@pytest.mark.parametrize('precision', [2, 3, 4, 5])
+def test_knn_matches_brute_force(points, queries, precision):
+    plat, plon = points
+    lat, lon = queries
+    index = GeohashIndex(plat, plon, precision=precision)
+    dist, idx = index.query(lat, lon, k=5)
+    expected = np.sort(brute_force(lat, lon, plat, plon), axis=1)[:, :5]
+    assert np.allclose(dist, expected, rtol=1e-12, atol=1e-9)
+    # indices point at points of those distances
+    assert np.allclose(haversine(lat[:, np.newaxis], lon[:, np.newaxis], plat[idx], plon[idx]), dist)
+
+
+@pytest.mark.parametrize('precision', [2, 3, 4, 5])
+def test_radius_matches_brute_force(points, queries, precision):
+    plat, plon = points
+    lat, lon = queries
+    index = GeohashIndex(plat, plon, precision=precision)
+    query, point, dist = index.query_radius(lat, lon, 150.0)
+    d = brute_force(lat, lon, plat, plon)
+    eq, ep = np.nonzero(d <= 150.0)
+    assert set(zip(query.tolist(), point.tolist())) == set(zip(eq.tolist(), ep.tolist()))
+    assert np.allclose(dist, d[query, point])
+    assert (np.diff(query) >= 0).all()
+
+
+def test_max_km_pads_with_inf_and_minus_one(points):
+    plat, plon = points
+    index = GeohashIndex(plat, plon, precision=4)
+    dist, idx = index.query([0.0], [0.0], k=3, max_km=1e-3)
+    assert np.isinf(dist).all() and (idx == -1).all()
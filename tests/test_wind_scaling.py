@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from read_data import bootstrap_wind_scaling_factor, determine_wind_scaling_factor, sweep_wind_scaling_factor
+
+
+def sites(lat, lon, capacity):
+    return pd.DataFrame({'lat': lat, 'lon': lon, 'capacity': capacity})
+
+
+@pytest.fixture
+def overlapping():
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(40, 42, 400), rng.uniform(-100, -98, 400)
+    return sites(lat, lon, rng.uniform(0.3, 0.5, 400)), sites(lat + 1e-4, lon, rng.uniform(0.2, 0.4, 400))
+
+
+def test_no_shared_cells_raises():
+    west = sites([40.0], [-120.0], [0.4])
+    east = sites([35.0], [-80.0], [0.3])
+    with pytest.raises(ValueError):
+        determine_wind_scaling_factor(west, east)
+    with pytest.raises(ValueError):
+        bootstrap_wind_scaling_factor(west, east, processes=1)
+
+
+def test_sweep_keeps_precisions_without_shared_cells(overlapping):
+    west, east = overlapping
+    sweep = sweep_wind_scaling_factor(west, east, precisions=(3, 9), n_boot=100, processes=1)
+    assert sweep['cells'].tolist()[1] == 0 and np.isnan(sweep['factor'][1])
+    assert sweep['cells'][0] > 0 and np.isfinite(sweep['factor'][0])
+
+
+def test_bootstrap_does_not_depend_on_process_count(overlapping):
+    west, east = overlapping
+    one = bootstrap_wind_scaling_factor(west, east, precision=3, n_boot=600, seed=7, processes=1)
+    three = bootstrap_wind_scaling_factor(west, east, precision=3, n_boot=600, seed=7, processes=3)
+    assert one == three
+    assert one['low'] <= one['factor'] <= one['high']
+    assert one['factor'] == determine_wind_scaling_factor(west, east, precision=3)